@@ -0,0 +1 @@
+# Offline benchmark harness: fake Pyrogram objects, a local Gemini/Imagen stub and scenarios.
@@ -0,0 +1,156 @@
+# Fake Pyrogram Client/Message objects for offline benchmarks.
+# They implement just enough of the Pyrogram API used by main.py and the plugins
+# (reply_text, reply, edit_text, delete, send_photo, send_document, edit_message_text,
+# delete_messages, get_me) and
+# record every outgoing action with a timestamp, so scenarios can measure latency
+# without a Telegram account.
+
+import time
+import random
+import asyncio
+import itertools
+from types import SimpleNamespace
+from pyrogram import enums
+from pyrogram.errors import FloodWait
+
+_message_ids = itertools.count(1000)
+_file_ids = itertools.count(1)
+
+
+class Recorder:
+    """Collects (timestamp, action, chat_id, message_id, text) tuples for every outgoing call."""
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, action: str, chat_id: int, message_id: int, text: str = None):
+        self.events.append((time.perf_counter(), action, chat_id, message_id, text))
+
+    def count(self, action: str) -> int:
+        return sum(1 for event in self.events if event[1] == action)
+
+
+class FakeSentMessage:
+    """A message sent by the fake client; supports the edits and deletes handlers make."""
+
+    def __init__(self, client, chat_id: int, text: str = None, photo=None, document=None):
+        self._client = client
+        self.id = next(_message_ids)
+        self.chat = SimpleNamespace(id=chat_id, type=enums.ChatType.PRIVATE)
+        self.text = text
+        self.photo = photo
+        self.document = document
+
+    async def edit_text(self, text: str, **kwargs):
+        await self._client.simulate_latency()
+        self.text = text
+        self._client.recorder.record("edit", self.chat.id, self.id, text)
+        return self
+
+    async def delete(self, **kwargs):
+        await self._client.simulate_latency()
+        self._client.recorder.record("delete", self.chat.id, self.id)
+        return True
+
+
+class FakeMessage:
+    """An incoming message as a handler sees it after Pyrogram's command filter has run."""
+
+    def __init__(self, client, text: str, chat_id: int = 1, user_id: int = 1, first_name: str = "Bench",
+                 outgoing: bool = False, prefixes: str = "./"):
+        self._client = client
+        self.id = next(_message_ids)
+        self.text = text
+        self.chat = SimpleNamespace(id=chat_id, type=enums.ChatType.PRIVATE)
+        self.from_user = SimpleNamespace(id=user_id, first_name=first_name, is_self=outgoing)
+        self.outgoing = outgoing
+        self.received_at = time.perf_counter()
+        # Mimic filters.command: ["cmd", "arg1", ...]
+        self.command = None
+        if text and text[0] in prefixes:
+            self.command = text[1:].split()
+            if self.command:
+                self.command[0] = self.command[0].lower()
+
+    async def reply_text(self, text: str, quote: bool = None, **kwargs):
+        await self._client.simulate_latency()
+        sent = FakeSentMessage(self._client, self.chat.id, text=text)
+        self._client.recorder.record("reply", self.chat.id, sent.id, text)
+        return sent
+
+    reply = reply_text
+
+
+class FakeClient:
+    """
+    Stands in for pyrogram.Client; `latency` simulates the Telegram round trip per call
+    and `flood_rate` is the fraction of calls rejected with a FloodWait of `flood_wait` seconds.
+    """
+
+    def __init__(self, name: str = "bench_user", latency: float = 0.0, me_id: int = 1,
+                 flood_rate: float = 0.0, flood_wait: int = 1):
+        self.name = name
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.me = SimpleNamespace(id=me_id, first_name="Me", is_self=True)
+        self.recorder = Recorder()
+        self.handlers = []
+
+    # --- Handler registration (plugins call these from setup()) ---
+
+    def add_handler(self, handler, group: int = 0):
+        self.handlers.append((handler, group))
+
+    def on_message(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.handlers.append((SimpleNamespace(callback=func, filters=filters), group))
+            return func
+        return decorator
+
+    def remove_handler(self, handler, group: int = 0):
+        self.handlers.remove((handler, group))
+
+    async def simulate_latency(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_rate and random.random() < self.flood_rate:
+            self.recorder.record("flood_wait", 0, 0)
+            raise FloodWait(value=self.flood_wait)
+
+    async def get_me(self):
+        return self.me
+
+    async def _send_media(self, action: str, chat_id: int, media, caption: str):
+        await self.simulate_latency()
+        size = len(media.getbuffer()) if hasattr(media, "getbuffer") else 0
+        file = SimpleNamespace(file_id=media if isinstance(media, str) else f"fake-file-{next(_file_ids)}", file_size=size)
+        if action == "send_photo":
+            sent = FakeSentMessage(self, chat_id, photo=file)
+        else:
+            sent = FakeSentMessage(self, chat_id, document=file)
+        self.recorder.record(action, chat_id, sent.id, caption)
+        return sent
+
+    async def send_photo(self, chat_id: int, photo, caption: str = None, **kwargs):
+        return await self._send_media("send_photo", chat_id, photo, caption)
+
+    async def send_document(self, chat_id: int, document, caption: str = None, **kwargs):
+        return await self._send_media("send_document", chat_id, document, caption)
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs):
+        await self.simulate_latency()
+        self.recorder.record("edit", chat_id, message_id, text)
+        return SimpleNamespace(id=message_id, chat=SimpleNamespace(id=chat_id), text=text)
+
+    async def delete_messages(self, chat_id: int, message_ids, **kwargs):
+        await self.simulate_latency()
+        for message_id in message_ids if isinstance(message_ids, (list, tuple)) else [message_ids]:
+            self.recorder.record("delete", chat_id, message_id)
+        return True
+
+    async def send_message(self, chat_id, text: str, **kwargs):
+        await self.simulate_latency()
+        sent = FakeSentMessage(self, chat_id if isinstance(chat_id, int) else 0, text=text)
+        self.recorder.record("send_message", sent.chat.id, sent.id, text)
+        return sent
@@ -0,0 +1,312 @@
+# Offline benchmark scenarios for auto_reply, ai_handler and image_handler.
+# Runs entirely on localhost: handlers talk to the fake client in bench/fakes.py and
+# the upstream calls go to the stub in bench/stub_server.py.
+#
+#   python -m bench.run                      # every scenario with default settings
+#   python -m bench.run ai --requests 500 --concurrency 50 --rate-429 0.05
+#   python -m bench.run ai --profile default fast  # compare runtime profiles (core/runtime.py)
+
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "plugins"))
+
+from bench.fakes import FakeClient, FakeMessage
+from bench.stub_server import GeminiStub, StubSettings
+from core import runtime
+
+SCENARIOS = ("auto_reply", "ai", "img")
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, latencies: list, elapsed: float, errors: int = 0, **extra) -> dict:
+    """Throughput and latency percentiles (milliseconds) for one scenario."""
+    return {
+        "scenario": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        **extra,
+    }
+
+
+def make_config(args, stub_url: str, cache_dir: str) -> dict:
+    config = {
+        "gemini_api_key": "bench-key",
+        "gemini_api_base": stub_url,
+        "cache_dir": cache_dir,
+        "ai_cache_enabled": args.cache,
+        "img_cache_enabled": args.cache,
+        "ai_stream": args.stream,
+        "ai_stream_interval": args.stream_interval,
+        "status": "offline",
+        "offline_message": "Benchmark offline message",
+        "auto_reply_delay": args.auto_reply_delay,
+        "auto_reply_cooldown": 0 if args.no_cooldown else 600,
+        # Jobs go to a throwaway queue; --concurrency is how many run at once
+        "job_db": os.path.join(cache_dir, "jobs.sqlite3"),
+        "job_concurrency": args.concurrency,
+    }
+    if not args.limits:
+        # Measure the code, not the configured upstream budget
+        config["rate_limits"] = {"gemini": {"rate": 1e6, "burst": 1e6}, "imagen": {"rate": 1e6, "burst": 1e6}}
+        # ...and the code, not Telegram's per-chat and per-account pace
+        config.update(outbox_chat_rate=1e6, outbox_group_rate=1e6, outbox_chat_burst=1e6,
+                      outbox_global_rate=1e6, outbox_global_burst=1e6)
+    return config
+
+
+async def run_concurrently(count: int, concurrency: int, job):
+    """Runs job(i) for i in range(count) with at most `concurrency` in flight. Returns elapsed seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            await job(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(count)))
+    return time.perf_counter() - started
+
+
+# --- Scenarios ---
+
+async def start_jobs(config: dict, client: FakeClient):
+    """Runs queued jobs for the fake client, like main() does for real clients."""
+    from core.jobs import job_queue
+    job_queue.configure(config)
+    job_queue.attach(client, config)
+    await job_queue.start()
+    return job_queue
+
+
+async def bench_ai(args, config: dict) -> list:
+    import ai
+    from core.ratelimit import rate_limiter
+    rate_limiter.configure(config)
+    client = FakeClient(latency=args.telegram_latency, flood_rate=args.flood_rate, flood_wait=args.flood_wait)
+    ai.setup(client, config, is_control_bot=False)
+    job_queue = await start_jobs(config, client)
+
+    latencies, first_edits, errors = [], [], 0
+    unique = max(1, int(args.requests * args.unique))
+    started_at = {}
+
+    async def job(i):
+        message = FakeMessage(client, f".ai benchmark question {i % unique}", chat_id=10_000 + i, outgoing=True)
+        started_at[message.chat.id] = time.perf_counter()
+        await ai.ai_handler(client, message, config, is_user_bot=True)
+
+    # The handler only queues the job; wait for the queue to drain before measuring
+    started = time.perf_counter()
+    await run_concurrently(args.requests, args.concurrency, job)
+    await job_queue.join()
+    elapsed = time.perf_counter() - started
+    await job_queue.stop()
+
+    for chat_id, chat_started in started_at.items():
+        edits = [event for event in client.recorder.events if event[1] == "edit" and event[2] == chat_id]
+        if not edits or "Error" in (edits[-1][4] or ""):
+            errors += 1
+            continue
+        first_edits.append(edits[0][0] - chat_started)
+        latencies.append(edits[-1][0] - chat_started)
+    return [
+        summarize("ai", latencies, elapsed, errors=errors, flood_waits=client.recorder.count("flood_wait")),
+        summarize("ai (first edit)", first_edits, elapsed),
+    ]
+
+
+async def bench_img(args, config: dict) -> list:
+    import image_gen
+    from core.ratelimit import rate_limiter
+    rate_limiter.configure(config)
+    client = FakeClient(latency=args.telegram_latency, flood_rate=args.flood_rate, flood_wait=args.flood_wait)
+    image_gen.setup(client, config, is_control_bot=False)
+    job_queue = await start_jobs(config, client)
+
+    latencies, errors = [], 0
+    unique = max(1, int(args.img_requests * args.unique))
+    started_at = {}
+
+    async def job(i):
+        message = FakeMessage(client, f".img benchmark picture {i % unique}", chat_id=20_000 + i, outgoing=True)
+        started_at[message.chat.id] = time.perf_counter()
+        await image_gen.image_handler(client, message, config, is_user_bot=True)
+
+    started = time.perf_counter()
+    await run_concurrently(args.img_requests, min(args.concurrency, args.img_requests), job)
+    await job_queue.join()
+    elapsed = time.perf_counter() - started
+    await job_queue.stop()
+
+    for chat_id, chat_started in started_at.items():
+        sent = [event for event in client.recorder.events if event[1] == "send_photo" and event[2] == chat_id]
+        if sent:
+            latencies.append(sent[0][0] - chat_started)
+        else:
+            errors += 1
+    return [summarize("img", latencies, elapsed, errors=errors, flood_waits=client.recorder.count("flood_wait"))]
+
+
+async def bench_auto_reply(args, config: dict) -> list:
+    import main
+    from core.autoreply import AutoReplyScheduler
+    client = FakeClient(latency=args.telegram_latency, flood_rate=args.flood_rate, flood_wait=args.flood_wait)
+    auto_replies = AutoReplyScheduler()
+    auto_replies.configure(config)
+
+    first_seen = {}
+    started = time.perf_counter()
+    for burst in range(args.burst):
+        for peer in range(args.peers):
+            chat_id = 30_000 + peer
+            message = FakeMessage(client, f"hello {burst}", chat_id=chat_id, user_id=chat_id)
+            first_seen.setdefault(chat_id, message.received_at)
+            await main.auto_reply_handler(client, message, config, auto_replies)
+
+    # Wait for every scheduled reply to go out
+    while auto_replies.pending:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - started
+
+    replies = [event for event in client.recorder.events if event[1] == "reply"]
+    latencies = [event[0] - first_seen[event[2]] for event in replies]
+    return [summarize("auto_reply", latencies, elapsed, messages=args.peers * args.burst, replies=len(replies),
+                      flood_waits=client.recorder.count("flood_wait"))]
+
+
+BENCHES = {"auto_reply": bench_auto_reply, "ai": bench_ai, "img": bench_img}
+
+
+def print_report(results: list, stub: GeminiStub):
+    header = f"{'scenario':<18}{'reqs':>7}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(f"{result['scenario']:<18}{result['requests']:>7}{result['errors']:>8}{result['throughput']:>10.1f}"
+              f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}")
+        if "replies" in result:
+            print(f"{'':<18}{result['messages']} incoming messages -> {result['replies']} replies")
+    print(f"\nStub served: {stub.counts}")
+    floods = sum(result.get("flood_waits", 0) for result in results)
+    if floods:
+        print(f"FloodWaits absorbed by the outbox: {floods}")
+
+
+async def run(args) -> list:
+    stub = GeminiStub(StubSettings(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_429=args.rate_429,
+        retry_after=args.retry_after, image_side=args.image_side,
+    ))
+    stub_url = await stub.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="ignitos-bench-") as cache_dir:
+            config = make_config(args, stub_url, cache_dir)
+            from core.outbox import outbox
+            outbox.configure(config)
+            for name in args.scenarios or SCENARIOS:
+                results.extend(await BENCHES[name](args, config))
+    finally:
+        from core.http import http_client
+        await http_client.close()
+        await stub.stop()
+    print_report(results, stub)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the Ignitos handlers.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--requests", type=int, default=200, help=".ai requests to send")
+    parser.add_argument("--img-requests", type=int, default=20, help=".img requests to send")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--unique", type=float, default=1.0, help="Fraction of distinct prompts (lower = more repeats)")
+    parser.add_argument("--cache", action="store_true", help="Enable the response/image caches")
+    parser.add_argument("--stream", action="store_true", help="Use streamGenerateContent for .ai")
+    parser.add_argument("--stream-interval", type=float, default=0.0, help="Minimum seconds between streamed edits")
+    parser.add_argument("--limits", action="store_true", help="Keep the default upstream and Telegram rate limits")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream 500s")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of upstream 429s")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After sent with 429s")
+    parser.add_argument("--image-side", type=int, default=1024, help="Side of the stub's PNG")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Simulated Telegram round trip")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Fraction of Telegram calls answered with FloodWait")
+    parser.add_argument("--flood-wait", type=int, default=1, help="Seconds of each simulated FloodWait")
+    parser.add_argument("--peers", type=int, default=500, help="auto_reply: distinct peers")
+    parser.add_argument("--burst", type=int, default=5, help="auto_reply: messages per peer")
+    parser.add_argument("--auto-reply-delay", type=float, default=0.0)
+    parser.add_argument("--no-cooldown", action="store_true")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--profile", nargs="+", choices=runtime.PROFILES, default=[runtime.DEFAULT_PROFILE],
+                        help="Runtime profile(s); with several, each runs in its own process and they are compared")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+
+def compare_profiles(argv: list, profiles: list) -> list:
+    """Runs the benchmark once per profile in a fresh process and prints the results side by side."""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ignitos-profiles-") as tmp:
+        for profile in profiles:
+            path = os.path.join(tmp, f"{profile}.json")
+            print(f"\n=== profile: {profile} ===", flush=True)
+            # The last --profile/--json on the command line wins
+            subprocess.run([sys.executable, "-m", "bench.run", *argv, "--profile", profile, "--json", path],
+                           cwd=ROOT, check=True)
+            with open(path) as f:
+                results.extend(json.load(f))
+
+    header = f"{'scenario':<18}{'profile':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(f"\n{header}\n{'-' * len(header)}")
+    for scenario in dict.fromkeys(result["scenario"] for result in results):
+        for result in results:
+            if result["scenario"] == scenario:
+                print(f"{scenario:<18}{result['profile']:<10}{result['throughput']:>10.1f}"
+                      f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}")
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parse_args(argv)
+    if len(args.profile) > 1:
+        results = compare_profiles(argv, args.profile)
+    else:
+        runtime.activate(args.profile[0])
+        print(runtime.report())
+        results = asyncio.run(run(args))
+        for result in results:
+            result["profile"] = args.profile[0]
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Local HTTP stub that mimics the Gemini generateContent/streamGenerateContent and
+# Imagen predict endpoints, with configurable latency, server errors and 429s.
+# Point the plugins at it with the 'gemini_api_base' config key.
+
+import json
+import zlib
+import random
+import struct
+import base64
+import asyncio
+from aiohttp import web
+
+
+def make_png(side: int, noise: bool = True) -> bytes:
+    """Builds an RGB PNG without PIL. Noise makes it as incompressible as a real render."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    row_bytes = side * 3
+    rng = random.Random(side)
+    if noise:
+        rows = b"".join(b"\x00" + rng.randbytes(row_bytes) for _ in range(side))
+    else:
+        rows = (b"\x00" + b"\x80" * row_bytes) * side
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b"")
+
+
+class StubSettings:
+    """Knobs for the simulated upstream behaviour."""
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, error_rate: float = 0.0,
+                 rate_429: float = 0.0, retry_after: float = 0.5, stream_chunks: int = 8,
+                 chunk_interval: float = 0.05, image_side: int = 1024, answer_words: int = 120, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.chunk_interval = chunk_interval
+        self.image_side = image_side
+        self.answer_words = answer_words
+        self.random = random.Random(seed)
+
+
+class GeminiStub:
+    """aiohttp application serving the fake endpoints and counting what it served."""
+
+    def __init__(self, settings: StubSettings = None):
+        self.settings = settings or StubSettings()
+        self.counts = {"generate": 0, "stream": 0, "predict": 0, "429": 0, "500": 0}
+        self.image_b64 = None
+        self.runner = None
+        self.base_url = None
+
+    def answer_for(self, prompt: str) -> str:
+        words = " ".join(f"word{i}" for i in range(self.settings.answer_words))
+        return f"Stub answer to: {prompt}\n{words}"
+
+    async def _simulate(self):
+        """Waits like the real API and returns an error response when one is due."""
+        settings = self.settings
+        await asyncio.sleep(max(0.0, settings.latency + settings.random.uniform(-settings.jitter, settings.jitter)))
+        roll = settings.random.random()
+        if roll < settings.rate_429:
+            self.counts["429"] += 1
+            return web.json_response({"error": {"code": 429, "message": "Resource exhausted (stub)"}},
+                                     status=429, headers={"Retry-After": str(settings.retry_after)})
+        if roll < settings.rate_429 + settings.error_rate:
+            self.counts["500"] += 1
+            return web.json_response({"error": {"code": 500, "message": "Internal error (stub)"}}, status=500)
+        return None
+
+    async def handle(self, request: web.Request):
+        name = request.match_info["name"]
+        body = await request.json()
+        error = await self._simulate()
+        if error is not None:
+            return error
+
+        if name.endswith(":predict"):
+            self.counts["predict"] += 1
+            return web.json_response({"predictions": [{"bytesBase64Encoded": self.image_b64, "mimeType": "image/png"}]})
+
+        prompt = body.get("contents", [{}])[-1].get("parts", [{}])[0].get("text", "")
+        answer = self.answer_for(prompt)
+        grounding = {"groundingAttributions": [{"web": {"uri": "https://example.com/stub", "title": "stub"}}]}
+        usage = {"promptTokenCount": len(prompt) // 4 + 1, "candidatesTokenCount": len(answer) // 4 + 1}
+
+        if name.endswith(":generateContent"):
+            self.counts["generate"] += 1
+            return web.json_response({
+                "candidates": [{"content": {"parts": [{"text": answer}], "role": "model"}, "groundingMetadata": grounding}],
+                "usageMetadata": usage,
+            })
+
+        if name.endswith(":streamGenerateContent"):
+            self.counts["stream"] += 1
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            chunks = self.settings.stream_chunks
+            step = max(1, len(answer) // chunks)
+            pieces = [answer[i:i + step] for i in range(0, len(answer), step)]
+            for index, piece in enumerate(pieces):
+                candidate = {"content": {"parts": [{"text": piece}], "role": "model"}}
+                event = {"candidates": [candidate]}
+                if index == len(pieces) - 1:
+                    candidate["groundingMetadata"] = grounding
+                    event["usageMetadata"] = usage
+                await response.write(b"data: " + json.dumps(event).encode() + b"\r\n\r\n")
+                await asyncio.sleep(self.settings.chunk_interval)
+            await response.write_eof()
+            return response
+
+        return web.json_response({"error": {"code": 404, "message": f"Unknown method {name}"}}, status=404)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts the stub and returns its base URL (…/v1beta/models)."""
+        self.image_b64 = base64.b64encode(make_png(self.settings.image_side)).decode()
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/v1beta/models/{name}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}/v1beta/models"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def serve_forever(settings: StubSettings, port: int):
+    stub = GeminiStub(settings)
+    base_url = await stub.start(port=port)
+    print(f"Gemini/Imagen stub listening on {base_url}")
+    print(f"Set \"gemini_api_base\": \"{base_url}\" in config.json to use it.")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the Gemini/Imagen stub server on its own.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(serve_forever(StubSettings(latency=args.latency, error_rate=args.error_rate, rate_429=args.rate_429), args.port))
@@ -0,0 +1 @@
+# Shared runtime services used by main.py and the plugins (HTTP pool, caches, schedulers).
@@ -0,0 +1,83 @@
+# Per-chat auto-reply scheduler.
+# A burst of messages from one peer collapses into a single delayed reply, each peer
+# gets at most one reply per cooldown window, and the cooldown table is a bounded
+# LRU so memory stays flat no matter how many peers write in.
+
+import time
+import asyncio
+from collections import OrderedDict
+from core.metrics import auto_reply_messages, auto_replies_sent
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_DELAY = 3             # Seconds to wait before replying (collects the burst)
+DEFAULT_COOLDOWN = 10 * 60    # Seconds before the same peer can get another reply
+DEFAULT_MAX_PEERS = 10000     # Peers remembered for cooldown purposes
+
+
+class AutoReplyScheduler:
+    """Collapses message bursts into one reply per chat, with a per-peer cooldown."""
+
+    def __init__(self):
+        self.delay = DEFAULT_DELAY
+        self.cooldown = DEFAULT_COOLDOWN
+        self.max_peers = DEFAULT_MAX_PEERS
+        self.pending = {}                 # chat_id -> (task, latest reply callable)
+        self.last_replied = OrderedDict() # chat_id -> monotonic time of the last reply
+
+    def configure(self, config: dict):
+        """Reads the optional auto_reply_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.delay = config.get('auto_reply_delay', self.delay)
+        self.cooldown = config.get('auto_reply_cooldown', self.cooldown)
+        self.max_peers = config.get('auto_reply_max_peers', self.max_peers)
+
+    def in_cooldown(self, chat_id: int) -> bool:
+        last = self.last_replied.get(chat_id)
+        return last is not None and time.monotonic() - last < self.cooldown
+
+    def schedule(self, chat_id: int, reply) -> bool:
+        """
+        Schedules `reply` (a zero-argument coroutine function) for the chat.
+        If a reply is already pending, it is replaced so the single reply answers
+        the latest message; `reply` may return False to signal nothing was sent.
+        Returns False when the peer is still in cooldown.
+        """
+        if chat_id in self.pending:
+            task, _ = self.pending[chat_id]
+            self.pending[chat_id] = (task, reply)
+            auto_reply_messages.inc(outcome="coalesced")
+            return True
+        if self.in_cooldown(chat_id):
+            auto_reply_messages.inc(outcome="cooldown")
+            return False
+        auto_reply_messages.inc(outcome="scheduled")
+        task = asyncio.create_task(self._fire(chat_id))
+        self.pending[chat_id] = (task, reply)
+        return True
+
+    async def _fire(self, chat_id: int):
+        try:
+            await asyncio.sleep(self.delay)
+            _, reply = self.pending[chat_id]
+            if await reply() is not False:
+                auto_replies_sent.inc()
+                # Only a reply that went out starts the cooldown; a failed one can be retried
+                self._mark(chat_id)
+        finally:
+            entry = self.pending.get(chat_id)
+            if entry is not None and entry[0] is asyncio.current_task():
+                del self.pending[chat_id]
+
+    def _mark(self, chat_id: int):
+        self.last_replied[chat_id] = time.monotonic()
+        self.last_replied.move_to_end(chat_id)
+        while len(self.last_replied) > self.max_peers:
+            self.last_replied.popitem(last=False)
+
+    def cancel_all(self):
+        """Cancels every pending reply and forgets cooldowns (used when going back online)."""
+        for task, _ in list(self.pending.values()):
+            task.cancel()
+        self.pending.clear()
+        self.last_replied.clear()
@@ -0,0 +1,140 @@
+# Two-tier response cache for AI answers.
+# Tier 1 is an in-memory LRU with TTL eviction (hits cost microseconds);
+# tier 2 is a small SQLite database so cached answers survive restarts.
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_CACHE_DIR = "cache"
+DEFAULT_MAX_ENTRIES = 512          # In-memory LRU capacity
+DEFAULT_TTL = 24 * 60 * 60         # Seconds an answer stays valid
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace and case so trivially different prompts share a cache entry."""
+    return " ".join(prompt.split()).casefold()
+
+
+class ResponseCache:
+    """LRU + TTL memory tier in front of a persistent SQLite tier."""
+
+    def __init__(self, name: str = "responses"):
+        self.name = name
+        self.enabled = True
+        self.cache_dir = DEFAULT_CACHE_DIR
+        self.max_entries = DEFAULT_MAX_ENTRIES
+        self.ttl = DEFAULT_TTL
+        self.memory = OrderedDict() # key -> (expires_at, value)
+        self.db = None
+        self.db_lock = threading.Lock()
+
+    def configure(self, config: dict):
+        """Reads the optional ai_cache_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.enabled = config.get('ai_cache_enabled', self.enabled)
+        self.cache_dir = config.get('cache_dir', self.cache_dir)
+        self.max_entries = config.get('ai_cache_size', self.max_entries)
+        self.ttl = config.get('ai_cache_ttl', self.ttl)
+
+    @staticmethod
+    def make_key(prompt: str, model: str, system_instruction: str, use_search: bool, context: list = None) -> str:
+        """Builds a stable key from everything that influences the answer, including any conversation history."""
+        parts = [normalize_prompt(prompt), model, system_instruction, bool(use_search)]
+        if context:
+            # Only follow-ups carry history, so keys of standalone prompts stay unchanged
+            parts.append(context)
+        raw = json.dumps(parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- SQLite tier (runs in a worker thread, never on the event loop) ---
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, f"{self.name}.sqlite3")
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            self.db.commit()
+        return self.db
+
+    def _db_get(self, key: str):
+        with self.db_lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _db_set(self, key: str, value, expires_at: float):
+        with self.db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            db.commit()
+
+    # --- Memory tier ---
+
+    def _remember(self, key: str, value, expires_at: float):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # --- Public API ---
+
+    async def get(self, key: str):
+        """Returns the cached value or None when missing or expired."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self.memory.move_to_end(key)
+                return value
+            del self.memory[key]
+
+        row = await asyncio.to_thread(self._db_get, key)
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            return None
+        # Promote to the memory tier so the next hit skips SQLite entirely
+        self._remember(key, value, expires_at)
+        return value
+
+    async def set(self, key: str, value):
+        """Stores a JSON-serialisable value in both tiers."""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        await asyncio.to_thread(self._db_set, key, value, expires_at)
+
+    def close(self):
+        """Closes the SQLite connection (the memory tier is simply dropped)."""
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# The cache shared by .ai and /ai on every client
+response_cache = ResponseCache()
@@ -0,0 +1,242 @@
+# Asynchronous, atomic, write-coalescing configuration store.
+# The bot works on an in-memory snapshot of config.json. Changes are batched into
+# a single write shortly after the last one, serialised on the loop and written
+# off the loop to a temporary file that atomically replaces config.json, so a
+# crash mid-write can never leave a truncated file behind.
+
+import os
+import asyncio
+import inspect
+import tempfile
+from collections.abc import MutableMapping
+from core.runtime import json_dumps, json_loads
+from core.log import get_logger
+
+DEFAULT_SAVE_DELAY = 0.5 # Seconds to wait for more changes before writing
+
+log = get_logger("config")
+
+
+def write_atomic(path: str, data: str):
+    """Writes data to a temporary file next to path, fsyncs it, then renames it over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ConfigStore(MutableMapping):
+    """A dict-like configuration that persists itself and notifies subscribers of changes."""
+
+    def __init__(self, path: str, data: dict = None, save_delay: float = DEFAULT_SAVE_DELAY):
+        self.path = path
+        self.data = dict(data or {})
+        self.save_delay = save_delay
+        self.subscribers = {} # key (None for every key) -> list of callbacks
+        self.save_handle = None
+        self.write_task = None
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str):
+        """Reads the configuration file once at startup. Returns None if it does not exist."""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return cls(path, json_loads(f.read()))
+
+    # --- Mapping interface (plugins keep using config.get / config[...] as before) ---
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        old = self.data.get(key)
+        self.data[key] = value
+        self.save()
+        if old != value:
+            self._notify(key, old, value)
+
+    def __delitem__(self, key):
+        old = self.data.pop(key)
+        self.save()
+        self._notify(key, old, None)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"ConfigStore({self.path!r}, keys={sorted(self.data)})"
+
+    # --- Change notifications ---
+
+    def subscribe(self, key, callback):
+        """
+        Calls callback(key, old_value, new_value) whenever key changes
+        (key=None subscribes to every key). Coroutine callbacks are scheduled as tasks.
+        """
+        self.subscribers.setdefault(key, []).append(callback)
+
+    def _notify(self, key, old, new):
+        for callback in self.subscribers.get(key, []) + self.subscribers.get(None, []):
+            try:
+                result = callback(key, old, new)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                log.error("Config subscriber for '%s' failed: %s", key, e)
+
+    # --- Persistence ---
+
+    def save(self):
+        """
+        Marks the configuration as changed. Inside a running loop the write is
+        coalesced with any other change made within save_delay seconds; without a
+        loop (plain scripts) it is written immediately.
+        Call this after mutating nested values (lists, dicts) in place.
+        """
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self.save_handle is None:
+            self.save_handle = loop.call_later(self.save_delay, self._start_write)
+
+    def _start_write(self):
+        self.save_handle = None
+        # A write already in progress loops until nothing is dirty, so one task is enough
+        if self.write_task is None or self.write_task.done():
+            self.write_task = asyncio.ensure_future(self._write())
+
+    async def _write(self):
+        while self.dirty:
+            self.dirty = False
+            # Serialise on the loop (consistent snapshot), write in a worker thread
+            data = json_dumps(self.data, indent=True)
+            try:
+                await asyncio.to_thread(write_atomic, self.path, data)
+            except Exception as e:
+                log.error("Failed to save configuration: %s", e)
+
+    async def flush(self):
+        """Writes any pending change now and waits until it is on disk."""
+        if self.save_handle is not None:
+            self.save_handle.cancel()
+            self.save_handle = None
+        if self.write_task is not None and not self.write_task.done():
+            await self.write_task
+        if self.dirty:
+            self.write_task = asyncio.ensure_future(self._write())
+            await self.write_task
+
+    def flush_sync(self):
+        """Blocking write, for code paths that run without an event loop."""
+        self.dirty = False
+        write_atomic(self.path, json_dumps(self.data, indent=True))
+
+
+# --- Multi-account views ---
+
+# Keys that belong to one account; everything else is shared by all accounts
+ACCOUNT_KEYS = ('name', 'session_string', 'bot_token', 'status', 'offline_message', 'auto_reply_rules')
+# Account keys that never fall back to the shared value (two accounts can't share a session)
+PRIVATE_KEYS = ('name', 'session_string', 'bot_token')
+
+
+class AccountConfig(MutableMapping):
+    """
+    One account's view of the configuration. Reads check the account's own entry
+    first and fall back to the shared keys; writes of per-account keys (status,
+    offline message, ...) stay in the account entry, everything else is shared.
+    """
+
+    def __init__(self, store: ConfigStore, account: dict = None, index: int = 1):
+        self.store = store
+        # None means the legacy single-account layout (everything at the top level)
+        self.account = account
+        self.index = index # Position in the 'accounts' list (1-based), names unnamed entries
+
+    @property
+    def name(self) -> str:
+        if self.account is None:
+            return self.store.get('account_name', 'main')
+        # Session files and per-account state are keyed by name, so the default is unique too
+        return str(self.account.get('name') or f"account{self.index}")
+
+    def _owns(self, key) -> bool:
+        return self.account is not None and (key in ACCOUNT_KEYS or key in self.account)
+
+    def __getitem__(self, key):
+        if self.account is not None and (key in self.account or key in PRIVATE_KEYS):
+            return self.account[key]
+        return self.store[key]
+
+    def __setitem__(self, key, value):
+        if not self._owns(key):
+            self.store[key] = value
+            return
+        old = self.account.get(key)
+        self.account[key] = value
+        self.store.save()
+        if old != value:
+            self.store._notify(key, old, value)
+
+    def __delitem__(self, key):
+        if self._owns(key) and key in self.account:
+            old = self.account.pop(key)
+            self.store.save()
+            self.store._notify(key, old, None)
+        else:
+            del self.store[key]
+
+    def __iter__(self):
+        keys = dict.fromkeys(self.store)
+        if self.account is not None:
+            keys.update(dict.fromkeys(self.account))
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"AccountConfig({self.name!r})"
+
+    # Persistence and notifications are shared with the underlying store
+    def save(self):
+        self.store.save()
+
+    async def flush(self):
+        await self.store.flush()
+
+    def subscribe(self, key, callback):
+        self.store.subscribe(key, callback)
+
+
+def account_configs(store: ConfigStore) -> list:
+    """
+    One AccountConfig per entry of the 'accounts' list, or a single view over the
+    top-level keys for the classic one-account config.json.
+    Raises ValueError if two entries have the same name.
+    """
+    accounts = store.get('accounts')
+    if not accounts:
+        return [AccountConfig(store)]
+    configs = [AccountConfig(store, account, index) for index, account in enumerate(accounts, 1)]
+    names = [config.name for config in configs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate account names in 'accounts': {', '.join(duplicates)}")
+    return configs
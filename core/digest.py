@@ -0,0 +1,208 @@
+# Away digest: what arrived while the status was 'offline', summarized in one go.
+# While away, every incoming private message is appended to a compact local log
+# (one JSON line per message: time, chat, sender, text). On /online the log is
+# grouped by chat and sent to Gemini as one batched request (split into a few
+# requests only if it would not fit `digest_chunk_tokens`), and the digest is
+# posted to Saved Messages. The log is removed once the digest was delivered;
+# if delivery fails it is kept and merged into the next digest.
+
+import os
+import json
+import time
+import asyncio
+import threading
+from core.http import http_client
+from core.ratelimit import PRIORITY_OWNER
+from core.outbox import outbox
+from core.log import get_logger
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_PATH = "away.jsonl"
+DEFAULT_MODEL = "gemini-2.5-flash-preview-05-20"
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+DEFAULT_CHUNK_TOKENS = 30000 # Transcript tokens per Gemini request
+DEFAULT_MAX_TEXT = 1000      # Characters kept per message
+CHARS_PER_TOKEN = 4          # Same estimate as the .ai conversation memory
+MESSAGE_LIMIT = 4000         # Telegram rejects messages longer than 4096 characters
+DIGEST_INSTRUCTION = (
+    "You summarize the private messages someone received while they were away. "
+    "For each chat, write one or two short lines: who wrote, what they want and anything urgent "
+    "or that needs a reply. List urgent chats first. Reply with the summary only."
+)
+
+log = get_logger("digest")
+
+
+def log_path(config: dict, suffix: str = "") -> str:
+    """The account's log file: away.jsonl, or away_<account>.jsonl for additional accounts."""
+    root, ext = os.path.splitext(config.get('away_log', DEFAULT_PATH))
+    return f"{root}{suffix}{ext}"
+
+
+def sender_name(message) -> str:
+    user = message.from_user
+    if not user:
+        return message.chat.title or str(message.chat.id)
+    name = " ".join(part for part in (user.first_name, user.last_name) if part)
+    return name or user.username or str(user.id)
+
+
+class AwayLog:
+    """Append-only log of the messages one account received while away."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    # --- File access (runs in a worker thread, never on the event loop) ---
+
+    def _append(self, line: str):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _take(self) -> list:
+        """
+        Moves the log aside (new messages start a fresh file) and returns its records,
+        together with those of a digest that was never delivered.
+        """
+        sending = self.path + ".sending"
+        with self.lock:
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as src, open(sending, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+            if not os.path.exists(sending):
+                return []
+            with open(sending, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue # A line cut short by a crash
+        return records
+
+    def _discard(self):
+        with self.lock:
+            try:
+                os.remove(self.path + ".sending")
+            except FileNotFoundError:
+                pass
+
+    # --- Async API ---
+
+    async def record(self, message, max_text: int = DEFAULT_MAX_TEXT):
+        """Appends one incoming message."""
+        text = message.text or message.caption or ""
+        if message.media:
+            text = f"[{message.media.value}] {text}".rstrip()
+        record = {"t": int(time.time()), "c": message.chat.id, "n": sender_name(message), "m": text[:max_text]}
+        await asyncio.to_thread(self._append, json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+
+    async def take(self) -> list:
+        return await asyncio.to_thread(self._take)
+
+    async def discard(self):
+        await asyncio.to_thread(self._discard)
+
+
+# --- Digest ---
+
+def transcript_chunks(records: list, chunk_tokens: int) -> list:
+    """
+    Renders the records grouped by chat (chats in order of their first message)
+    and splits the transcript into chunks of at most chunk_tokens (estimated).
+    A chat that does not fit in the rest of a chunk continues in the next one.
+    """
+    chats = {}
+    for record in records:
+        chats.setdefault(record["c"], []).append(record)
+    limit = max(1, chunk_tokens) * CHARS_PER_TOKEN
+    chunks, lines, size = [], [], 0
+    for chat_id, messages in chats.items():
+        header = f"## {messages[-1]['n']} (chat {chat_id}, {len(messages)} messages)"
+        block = [header]
+        for record in messages:
+            line = f"[{time.strftime('%H:%M', time.localtime(record['t']))}] {record['m']}"[:limit - len(header) - 2]
+            if size + len(header) + len(line) + 2 > limit and lines:
+                chunks.append("\n".join(lines))
+                lines, size, block = [], 0, [header]
+            if block:
+                lines.extend(block)
+                size += len(header) + 1
+                block = []
+            lines.append(line)
+            size += len(line) + 1
+    if lines:
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+def plain_digest(records: list) -> str:
+    """Fallback digest without Gemini: per chat, the number of messages and the latest one."""
+    chats = {}
+    for record in records:
+        chats.setdefault(record["c"], []).append(record)
+    return "\n".join(
+        f"• **{messages[-1]['n']}** ({len(messages)}): {messages[-1]['m'][:200]}"
+        for messages in chats.values()
+    )
+
+
+async def summarize_chunk(config: dict, transcript: str) -> str:
+    """One Gemini request for one transcript chunk. Returns the summary, or None on any failure."""
+    api_key = config.get('gemini_api_key')
+    if not api_key:
+        return None
+    api_base = config.get('gemini_api_base', DEFAULT_API_BASE).rstrip("/")
+    url = f"{api_base}/{config.get('digest_model', DEFAULT_MODEL)}:generateContent?key={api_key}"
+    payload = {
+        "contents": [{"parts": [{"text": transcript}]}],
+        "systemInstruction": {"parts": [{"text": DIGEST_INSTRUCTION}]}
+    }
+    try:
+        result = await http_client.post_json(url, payload, endpoint="gemini", priority=PRIORITY_OWNER)
+        text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text')
+        return text.strip() if text else None
+    except Exception as e:
+        log.warning("Away digest: Gemini request failed: %s", e)
+        return None
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """Splits text into Telegram-sized messages, at line breaks where possible."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        cut = cut if cut > 0 else limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    return parts + [text] if text else parts
+
+
+async def send_away_digest(client, config: dict, away_log: AwayLog) -> bool:
+    """
+    Summarizes everything in the away log and posts it to Saved Messages.
+    Returns False if there was nothing to send or delivery failed (the log is then kept).
+    """
+    records = await away_log.take()
+    if not records:
+        return False
+    chunks = transcript_chunks(records, int(config.get('digest_chunk_tokens', DEFAULT_CHUNK_TOKENS)))
+    summaries = await asyncio.gather(*(summarize_chunk(config, chunk) for chunk in chunks))
+    if all(summaries):
+        body = "\n\n".join(summaries)
+    else:
+        body = plain_digest(records)
+    chats = len({record["c"] for record in records})
+    text = f"📬 **Away digest**: {len(records)} messages from {chats} chats\n\n{body}"
+    try:
+        for part in split_message(text):
+            await outbox.send_message(client, "me", part)
+    except Exception as e:
+        log.warning("Away digest could not be delivered (kept for the next one): %s", e)
+        return False
+    await away_log.discard()
+    return True
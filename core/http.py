@@ -0,0 +1,189 @@
+# Shared asynchronous HTTP client for upstream API calls (Gemini, Imagen).
+# A single pooled aiohttp session is opened together with the Pyrogram clients and
+# closed on shutdown, so bursts of .ai/.img commands reuse keep-alive connections
+# instead of opening a new TLS connection (and a thread) per request.
+
+import time
+import asyncio
+import aiohttp
+from email.utils import parsedate_to_datetime
+from core.ratelimit import rate_limiter, PRIORITY_BOT
+from core.runtime import json_dumps_bytes, json_loads
+from core.log import note_upstream
+from core.metrics import upstream_seconds, upstream_requests, upstream_retries, upstream_throttled
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_TIMEOUT = 60       # Total seconds allowed for one request
+DEFAULT_POOL_SIZE = 20     # Maximum simultaneous connections in the pool
+DEFAULT_KEEPALIVE = 75     # Seconds an idle connection is kept open for reuse
+DEFAULT_RETRIES = 3        # Attempts per request (first try included)
+
+
+class RequestError(Exception):
+    """Raised when an upstream request cannot be completed (connection error, timeout)."""
+    pass
+
+
+class HttpError(RequestError):
+    """Raised when the upstream API answers with a non-success status code."""
+
+    def __init__(self, status: int, message: str, retry_after: float = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _is_retryable(status: int) -> bool:
+    """Rate limiting and server-side errors are worth another attempt."""
+    return status == 429 or status >= 500
+
+
+def parse_retry_after(value: str):
+    """Parses a Retry-After header (delta seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class HttpClient:
+    """A pooled, keep-alive HTTP session with timeouts and non-blocking retries."""
+
+    def __init__(self):
+        self.session = None
+        self.timeout = DEFAULT_TIMEOUT
+        self.pool_size = DEFAULT_POOL_SIZE
+        self.keepalive = DEFAULT_KEEPALIVE
+        self.retries = DEFAULT_RETRIES
+
+    def configure(self, config: dict):
+        """Reads the optional http_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.timeout = config.get('http_timeout', self.timeout)
+        self.pool_size = config.get('http_pool_size', self.pool_size)
+        self.keepalive = config.get('http_keepalive', self.keepalive)
+        self.retries = max(1, config.get('http_retries', self.retries))
+
+    async def start(self, config: dict = None):
+        """Opens the shared session. Safe to call more than once."""
+        self.configure(config)
+        if self.session and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            keepalive_timeout=self.keepalive,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'Content-Type': 'application/json'},
+        )
+
+    async def close(self):
+        """Closes the shared session and every pooled connection."""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def _request(self, url: str, payload: dict, timeout: float, retries: int, endpoint: str, priority: int):
+        """
+        Sends the POST and returns an open response with a success status.
+        When an endpoint name is given, every attempt first takes a token from the
+        shared rate limiter, and a 429 pauses that endpoint for its Retry-After.
+        All waiting uses asyncio, so it never blocks the event loop or a thread.
+        """
+        if not self.session or self.session.closed:
+            # Lazily start when used outside main() (e.g. from a script)
+            await self.start()
+
+        attempts = retries or self.retries
+        # Always explicit: aiohttp treats timeout=None as "no timeout", not as the session default
+        request_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        # Serialised once for every attempt (orjson in the fast runtime profile)
+        body = json_dumps_bytes(payload)
+        label = endpoint or "other"
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            if attempt:
+                upstream_retries.inc(endpoint=label)
+            if endpoint:
+                await rate_limiter.acquire(endpoint, priority)
+            started = time.perf_counter()
+            try:
+                response = await self.session.post(url, data=body, timeout=request_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                upstream_requests.inc(endpoint=label, status="error")
+                note_upstream(label, "error")
+                if not last_attempt:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                raise RequestError(f"{type(e).__name__}: {e}") from e
+            finally:
+                upstream_seconds.observe(time.perf_counter() - started, endpoint=label)
+
+            upstream_requests.inc(endpoint=label, status=response.status)
+            note_upstream(label, response.status)
+            if response.status < 400:
+                return response
+
+            async with response:
+                message = await response.text()
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            backoff = retry_after if retry_after is not None else 2 ** attempt
+
+            if response.status == 429:
+                upstream_throttled.inc(endpoint=label)
+            if response.status == 429 and endpoint:
+                # Back off globally: the next acquire() waits until the pause is over
+                rate_limiter.penalize(endpoint, backoff)
+                if not last_attempt:
+                    continue
+            elif _is_retryable(response.status) and not last_attempt:
+                await asyncio.sleep(backoff)
+                continue
+            raise HttpError(response.status, message[:500], retry_after)
+
+    async def post_json(self, url: str, payload: dict, timeout: float = None, retries: int = None,
+                        endpoint: str = None, priority: int = PRIORITY_BOT) -> dict:
+        """
+        POSTs a JSON payload and returns the decoded JSON response.
+        Rate limits (429) and 5xx errors are retried with exponential backoff.
+        """
+        response = await self._request(url, payload, timeout, retries, endpoint, priority)
+        async with response:
+            try:
+                return await response.json(content_type=None, loads=json_loads)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise RequestError(f"{type(e).__name__}: {e}") from e
+
+    async def stream_sse(self, url: str, payload: dict, timeout: float = None, retries: int = None,
+                         endpoint: str = None, priority: int = PRIORITY_BOT):
+        """
+        POSTs a JSON payload to a Server-Sent Events endpoint and yields each
+        decoded `data:` event as it arrives. Only the connection phase is retried;
+        once events have been yielded, errors propagate to the caller.
+        """
+        response = await self._request(url, payload, timeout, retries, endpoint, priority)
+        async with response:
+            try:
+                async for raw_line in response.content:
+                    line = raw_line.strip()
+                    if line.startswith(b"data:"):
+                        yield json_loads(line[5:])
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise RequestError(f"Stream interrupted: {type(e).__name__}: {e}") from e
+
+
+# The single client shared by every plugin
+http_client = HttpClient()
@@ -0,0 +1,178 @@
+# Content-addressed cache for generated images.
+# Image bytes live on disk under their SHA-256, an SQLite index maps each request
+# (prompt + Imagen parameters + delivery settings) to its image, and the Telegram
+# file_id returned by each client is remembered so a repeat can be re-sent without
+# uploading anything or calling Imagen again. Disk use is capped with LRU eviction.
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import asyncio
+import threading
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_CACHE_DIR = "cache"
+DEFAULT_MAX_MB = 200
+
+
+class ImageCache:
+    """Disk blob store + SQLite index + per-client Telegram file_id memo."""
+
+    def __init__(self):
+        self.enabled = True
+        self.cache_dir = DEFAULT_CACHE_DIR
+        self.max_bytes = DEFAULT_MAX_MB * 1024 * 1024
+        self.db = None
+        self.db_lock = threading.Lock()
+
+    def configure(self, config: dict):
+        """Reads the optional img_cache_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.enabled = config.get('img_cache_enabled', self.enabled)
+        self.cache_dir = config.get('cache_dir', self.cache_dir)
+        self.max_bytes = int(config.get('img_cache_max_mb', self.max_bytes / (1024 * 1024)) * 1024 * 1024)
+
+    @staticmethod
+    def make_key(prompt: str, parameters: dict, delivery: tuple) -> str:
+        """Builds a stable key from the prompt, Imagen parameters and delivery settings."""
+        raw = json.dumps([" ".join(prompt.split()), parameters, list(delivery)], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- SQLite index (runs in a worker thread, never on the event loop) ---
+
+    @property
+    def blob_dir(self):
+        return os.path.join(self.cache_dir, "images")
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(self.cache_dir, "images.sqlite3"), check_same_thread=False)
+            self.db.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, blob TEXT NOT NULL, name TEXT NOT NULL, last_used REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, size INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS file_ids (blob TEXT NOT NULL, client TEXT NOT NULL, kind TEXT NOT NULL,
+                                                     file_id TEXT NOT NULL, PRIMARY KEY (blob, client, kind));
+            """)
+        return self.db
+
+    def _blob_path(self, blob: str) -> str:
+        return os.path.join(self.blob_dir, blob)
+
+    def _lookup(self, key: str, client: str, kind: str):
+        with self.db_lock:
+            db = self._connect()
+            row = db.execute("SELECT blob, name FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            blob, name = row
+            path = self._blob_path(blob)
+            if not os.path.exists(path):
+                # Someone removed the file behind our back; forget the entry
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            file_id = db.execute(
+                "SELECT file_id FROM file_ids WHERE blob = ? AND client = ? AND kind = ?", (blob, client, kind)
+            ).fetchone()
+            db.commit()
+        return {"path": path, "name": name, "file_id": file_id[0] if file_id else None}
+
+    def _store(self, key: str, data: bytes, name: str):
+        blob = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(blob)
+        with self.db_lock:
+            db = self._connect()
+            if not os.path.exists(path):
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            db.execute("INSERT OR REPLACE INTO blobs (hash, size) VALUES (?, ?)", (blob, len(data)))
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, blob, name, last_used) VALUES (?, ?, ?, ?)",
+                (key, blob, name, time.time()),
+            )
+            db.commit()
+            self._evict(db)
+        return path
+
+    def _evict(self, db):
+        """Drops least-recently-used entries until the blobs fit under max_bytes."""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, blob in db.execute("SELECT key, blob FROM entries ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            still_used = db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (blob,)).fetchone()
+            if still_used:
+                continue
+            size = db.execute("SELECT size FROM blobs WHERE hash = ?", (blob,)).fetchone()
+            db.execute("DELETE FROM blobs WHERE hash = ?", (blob,))
+            db.execute("DELETE FROM file_ids WHERE blob = ?", (blob,))
+            try:
+                os.remove(self._blob_path(blob))
+            except FileNotFoundError:
+                pass
+            total -= size[0] if size else 0
+        db.commit()
+
+    def _remember_file_id(self, path: str, client: str, kind: str, file_id: str):
+        blob = os.path.basename(path)
+        with self.db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO file_ids (blob, client, kind, file_id) VALUES (?, ?, ?, ?)",
+                (blob, client, kind, file_id),
+            )
+            db.commit()
+
+    def _forget_file_id(self, path: str, client: str, kind: str):
+        with self.db_lock:
+            db = self._connect()
+            db.execute(
+                "DELETE FROM file_ids WHERE blob = ? AND client = ? AND kind = ?",
+                (os.path.basename(path), client, kind),
+            )
+            db.commit()
+
+    # --- Public API ---
+
+    async def lookup(self, key: str, client: str, kind: str):
+        """Returns {'path', 'name', 'file_id'} for a cached image, or None."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._lookup, key, client, kind)
+
+    async def store(self, key: str, data: bytes, name: str):
+        """Writes the image to disk (deduplicated by content) and returns its path."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._store, key, data, name)
+
+    async def remember_file_id(self, path: str, client: str, kind: str, file_id: str):
+        """Stores the Telegram file_id a client got when uploading the cached image."""
+        if self.enabled and path:
+            await asyncio.to_thread(self._remember_file_id, path, client, kind, file_id)
+
+    async def forget_file_id(self, path: str, client: str, kind: str):
+        """Drops a file_id Telegram no longer accepts (the bytes on disk are kept)."""
+        if self.enabled and path:
+            await asyncio.to_thread(self._forget_file_id, path, client, kind)
+
+    def close(self):
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# The cache shared by .img and /img on every client
+image_cache = ImageCache()
@@ -0,0 +1,233 @@
+# Durable job queue for long-running commands (.ai, .img).
+# Command handlers only validate the command, post an acknowledgement and enqueue a job.
+# Jobs are stored in SQLite, so work that was queued or running when the process stopped
+# is picked up again on the next start. A dispatcher in the client process claims up to
+# `job_concurrency` jobs at a time and hands each one to the runner its plugin registered,
+# together with the client (by session name) and config of the account it came from.
+# Runners do their network I/O on the shared HTTP pool (one connection pool, one rate
+# limit, one response cache for every job), push CPU-heavy work into worker processes
+# (see core/media.py) and deliver the result through the chat and message ids stored
+# with the job.
+
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from core.metrics import job_queue_depth, jobs_finished
+from core.log import get_logger
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_PATH = "jobs.sqlite3"
+DEFAULT_CONCURRENCY = 4  # Jobs running at the same time (across all clients)
+DEFAULT_MAX_ATTEMPTS = 3 # Runs of a job that raised before it is marked as failed
+
+log = get_logger("jobs")
+
+
+class Job:
+    """One queued command: where it came from, where the answer goes and what to do."""
+
+    __slots__ = ("id", "kind", "client", "chat_id", "reply_to", "status_id", "payload", "attempts", "created_at")
+
+    def __init__(self, id, kind, client, chat_id, reply_to, status_id, payload, attempts, created_at):
+        self.id = id
+        self.kind = kind           # Name of the plugin whose runner handles the job
+        self.client = client       # Session name of the client that received the command
+        self.chat_id = chat_id
+        self.reply_to = reply_to   # The command message
+        self.status_id = status_id # The acknowledgement message the runner edits or deletes
+        self.payload = json.loads(payload) if isinstance(payload, str) else payload
+        self.attempts = attempts
+        self.created_at = created_at
+
+
+class JobQueue:
+    """SQLite-backed queue with a dispatcher that runs jobs through registered runners."""
+
+    def __init__(self):
+        self.path = DEFAULT_PATH
+        self.concurrency = DEFAULT_CONCURRENCY
+        self.max_attempts = DEFAULT_MAX_ATTEMPTS
+        self.db = None
+        self.db_lock = threading.Lock()
+        self.runners = {}  # kind -> async runner(client, config, job)
+        self.clients = {}  # client name -> (client, config)
+        self.running = {}  # job id -> task
+        self.queued = 0    # Claimable jobs seen by the last claim (for metrics)
+        self.claiming = False
+        self.wakeup = None
+        self.dispatcher = None
+        job_queue_depth.track(lambda: self.queued, state="queued")
+        job_queue_depth.track(lambda: len(self.running), state="running")
+
+    def configure(self, config: dict):
+        """Reads the optional job_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.path = config.get('job_db', self.path)
+        self.concurrency = max(1, int(config.get('job_concurrency', self.concurrency)))
+        self.max_attempts = max(1, int(config.get('job_max_attempts', self.max_attempts)))
+        self._wake()
+
+    def register(self, kind: str, runner):
+        """Sets the coroutine function that runs jobs of this kind (plugins call this from setup())."""
+        self.runners[kind] = runner
+        self._wake()
+
+    def attach(self, client, config: dict):
+        """Makes a client (and its account config) available to runners of its jobs."""
+        self.clients[client.name] = (client, config)
+        self._wake()
+
+    # --- SQLite (runs in a worker thread, never on the event loop) ---
+
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, client TEXT NOT NULL,
+                    chat_id INTEGER NOT NULL, reply_to INTEGER, status_id INTEGER, payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL, error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+            """)
+        return self.db
+
+    def _insert(self, kind, client, chat_id, reply_to, status_id, payload) -> int:
+        with self.db_lock:
+            db = self._connect()
+            cursor = db.execute(
+                "INSERT INTO jobs (kind, client, chat_id, reply_to, status_id, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, client, chat_id, reply_to, status_id, payload, time.time()),
+            )
+            db.commit()
+            return cursor.lastrowid
+
+    def _claim(self, limit: int, kinds: list, clients: list) -> list:
+        """Marks up to `limit` runnable queued jobs as running and returns them, oldest first."""
+        if not kinds or not clients:
+            return []
+        marks = lambda items: ",".join("?" * len(items))
+        where = f"status = 'queued' AND kind IN ({marks(kinds)}) AND client IN ({marks(clients)})"
+        with self.db_lock:
+            db = self._connect()
+            rows = db.execute(
+                f"SELECT id, kind, client, chat_id, reply_to, status_id, payload, attempts, created_at FROM jobs "
+                f"WHERE {where} ORDER BY id LIMIT ?", (*kinds, *clients, limit)
+            ).fetchall()
+            db.executemany("UPDATE jobs SET status = 'running', attempts = attempts + 1 WHERE id = ?",
+                           [(row[0],) for row in rows])
+            db.commit()
+            self.queued = db.execute(f"SELECT COUNT(*) FROM jobs WHERE {where}", (*kinds, *clients)).fetchone()[0]
+        return [Job(*row[:7], row[7] + 1, row[8]) for row in rows]
+
+    def _finish(self, job_id: int, status: str = None, error: str = None):
+        """Deletes a finished job, or moves it to `status` ('queued' to retry, 'failed')."""
+        with self.db_lock:
+            db = self._connect()
+            if status is None:
+                db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            else:
+                db.execute("UPDATE jobs SET status = ?, error = ? WHERE id = ?", (status, error, job_id))
+            db.commit()
+
+    def _recover(self) -> list:
+        """Requeues jobs that were running when the process stopped. Returns (kind, client) of pending jobs."""
+        with self.db_lock:
+            db = self._connect()
+            db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            db.commit()
+            return db.execute("SELECT DISTINCT kind, client FROM jobs WHERE status = 'queued'").fetchall()
+
+    # --- Async API ---
+
+    async def enqueue(self, kind: str, client: str, chat_id: int, reply_to: int, status_id: int, payload: dict) -> int:
+        """Stores a job durably and wakes the dispatcher. Returns the job id."""
+        job_id = await asyncio.to_thread(
+            self._insert, kind, client, chat_id, reply_to, status_id, json.dumps(payload)
+        )
+        self._wake()
+        return job_id
+
+    async def pending(self) -> list:
+        """(kind, client name) of every job left over from the last run, requeued and waiting."""
+        return [tuple(row) for row in await asyncio.to_thread(self._recover)]
+
+    def _wake(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def start(self):
+        """Starts the dispatcher (idempotent). Jobs are only run for attached clients and registered kinds."""
+        if self.dispatcher is None:
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            self.wakeup.clear()
+            free = self.concurrency - len(self.running)
+            jobs = []
+            if free > 0:
+                self.claiming = True
+                try:
+                    jobs = await asyncio.to_thread(self._claim, free, list(self.runners), list(self.clients))
+                except Exception as e:
+                    log.error("Job queue error: %s", e)
+                finally:
+                    self.claiming = False
+            for job in jobs:
+                self.running[job.id] = asyncio.create_task(self._run(job))
+            if len(jobs) < free or free <= 0:
+                # Nothing more to claim right now: sleep until a job is enqueued or finishes
+                await self.wakeup.wait()
+
+    async def _run(self, job: Job):
+        client, config = self.clients[job.client]
+        try:
+            await self.runners[job.kind](client, config, job)
+            await asyncio.to_thread(self._finish, job.id)
+            jobs_finished.inc(kind=job.kind, outcome="done")
+        except asyncio.CancelledError:
+            # Shutdown: the row stays 'running' and is requeued on the next start
+            raise
+        except Exception as e:
+            retry = job.attempts < self.max_attempts
+            log.log(logging.WARNING if retry else logging.ERROR, "Job %s (%s) failed on attempt %s: %s: %s",
+                    job.id, job.kind, job.attempts, type(e).__name__, e)
+            await asyncio.to_thread(self._finish, job.id, "queued" if retry else "failed", f"{type(e).__name__}: {e}")
+            jobs_finished.inc(kind=job.kind, outcome="retried" if retry else "failed")
+        finally:
+            self.running.pop(job.id, None)
+            self._wake()
+
+    async def join(self, poll: float = 0.01):
+        """Waits until no job is running and nothing runnable is queued (used by benchmarks)."""
+        while True:
+            await asyncio.sleep(poll)
+            if not (self.running or self.queued or self.claiming or (self.wakeup and self.wakeup.is_set())):
+                return
+
+    async def stop(self):
+        """Stops the dispatcher and cancels running jobs; they run again after the next start."""
+        tasks = list(self.running.values())
+        if self.dispatcher is not None:
+            tasks.append(self.dispatcher)
+            self.dispatcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.running.clear()
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# The queue shared by every plugin and client in this process
+job_queue = JobQueue()
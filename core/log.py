@@ -0,0 +1,161 @@
+# Non-blocking logging.
+# Handlers, plugins and core modules log through loggers under "ignitos" (get_logger).
+# The only handler on the event loop is a QueueHandler, which puts the record on an
+# in-memory queue; a QueueListener thread formats it and writes it to stdout (and
+# `log_file`, if set), so a slow terminal or journald never stalls the loop.
+# Levels: `log_level` for everything (default INFO) and `log_levels` per logger,
+# e.g. {"ai": "DEBUG", "jobs": "WARNING"}. Log with %-style arguments
+# (log.debug("Replied to %s", name)): a disabled level returns before any formatting.
+# Every command timed with core.metrics.timed produces one structured record on the
+# "command" logger with its name, chat, latency, outcome and last upstream status;
+# set `log_format` to "json" to get every record as one JSON object per line. High-volume
+# handlers (auto_reply runs for every incoming private message) log theirs at DEBUG.
+
+import sys
+import json
+import time
+import queue
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT = "ignitos"
+DEFAULT_LEVEL = "INFO"
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# The structured record of the command the current task is running (see core.metrics.timed)
+current_command = contextvars.ContextVar("current_command", default=None)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """The logger of a core module or plugin ("jobs", "ai", ...)."""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+class TextFormatter(logging.Formatter):
+    """Classic one-line format with the record's structured fields appended as key=value."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items() if value is not None)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record (for log shippers)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name[len(ROOT) + 1:] or record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(QueueHandler):
+    """Enqueues the record as it is: formatting is left to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve %-arguments now, while they still hold their current values
+        # (the exception text is formatted later, by the listener)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LogSystem:
+    """The queue, the listener thread and the level configuration."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        self.configured_levels = {}
+
+    def configure(self, config: dict):
+        """Installs the queue handler and (re)starts the listener with the configured outputs and levels."""
+        config = config or {}
+        root = logging.getLogger(ROOT)
+        root.propagate = False
+        if not any(isinstance(handler, LogQueueHandler) for handler in root.handlers):
+            root.addHandler(LogQueueHandler(self.queue))
+        self.set_levels(config)
+
+        formatter = JsonFormatter() if config.get('log_format') == "json" else TextFormatter(TEXT_FORMAT)
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if config.get('log_file'):
+            handlers.append(logging.FileHandler(config['log_file'], encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.stop()
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=False)
+        self.listener.start()
+
+    def set_levels(self, config: dict):
+        """Applies log_level and the per-logger log_levels; loggers dropped from the mapping inherit again."""
+        logging.getLogger(ROOT).setLevel(str(config.get('log_level', DEFAULT_LEVEL)).upper())
+        levels = config.get('log_levels') or {}
+        for name in set(self.configured_levels) - set(levels):
+            get_logger(name).setLevel(logging.NOTSET)
+        for name, level in levels.items():
+            get_logger(name).setLevel(str(level).upper())
+        self.configured_levels = dict(levels)
+
+    def stop(self):
+        """Writes out whatever is still queued and stops the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+
+# The logging system of this process
+log_system = LogSystem()
+command_log = get_logger("command")
+
+
+# --- Structured command records ---
+
+def chat_of(args) -> int:
+    """The chat a handler works on: from its Message or queued Job argument."""
+    for arg in args:
+        chat = getattr(arg, "chat", None)
+        if chat is not None:
+            return chat.id
+        chat_id = getattr(arg, "chat_id", None)
+        if chat_id is not None:
+            return chat_id
+    return None
+
+
+def note_upstream(endpoint: str, status):
+    """Records an upstream response (or error) on the current command's record."""
+    record = current_command.get()
+    if record is not None:
+        record["endpoint"] = endpoint
+        record["upstream"] = status
+
+
+def start_command(command: str, args) -> tuple:
+    """Opens the record of a command; pass the result to finish_command."""
+    record = {"command": command, "chat": chat_of(args)}
+    return record, current_command.set(record), time.perf_counter()
+
+
+def finish_command(state: tuple, outcome: str, level: int = logging.INFO):
+    """Logs the command's record at level (failures at INFO or above)."""
+    record, token, started = state
+    current_command.reset(token)
+    if outcome != "ok":
+        level = max(level, logging.INFO)
+    if command_log.isEnabledFor(level):
+        record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        record["outcome"] = outcome
+        command_log.log(level, "%s %s", record["command"], outcome, extra={"fields": record})
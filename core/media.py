@@ -0,0 +1,110 @@
+# Image delivery stage for generated images.
+# Decoding the base64 payload and re-encoding it to a smaller JPEG/WebP happen in a
+# worker pool, so multi-megabyte PNGs neither block the event loop nor dominate
+# upload time on a slow uplink. By default the pool is made of worker processes, so
+# the transcode does not compete with update handling for the GIL either.
+
+import base64
+import asyncio
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image
+from core.metrics import executor_queue_depth
+from core.log import get_logger
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_FORMAT = "jpeg"  # jpeg, webp or png
+DEFAULT_QUALITY = 90     # Encoder quality for jpeg/webp (1-100)
+DEFAULT_MAX_SIDE = 0     # Downscale so the longest side fits (0 keeps the original size)
+DEFAULT_WORKERS = 2
+DEFAULT_PROCESSES = True # Worker processes (False: threads in this process)
+
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+log = get_logger("media")
+
+
+def prepare_image(base64_data: str, fmt: str = DEFAULT_FORMAT, quality: int = DEFAULT_QUALITY,
+                  max_side: int = DEFAULT_MAX_SIDE):
+    """
+    Decodes a base64 image and re-encodes it for upload.
+    Returns (image bytes, file name). Runs in a worker, never on the event loop.
+    """
+    raw = base64.b64decode(base64_data)
+    if fmt == "png" and not max_side:
+        # Full fidelity: send the original bytes untouched
+        return raw, "generated_image.png"
+
+    image = Image.open(BytesIO(raw))
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out = BytesIO()
+    if fmt == "jpeg":
+        image.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "webp":
+        image.save(out, "WEBP", quality=quality, method=4)
+    else:
+        image.save(out, "PNG", optimize=True)
+    return out.getvalue(), f"generated_image.{EXTENSIONS.get(fmt, 'png')}"
+
+
+class ImagePipeline:
+    """Runs prepare_image in a dedicated worker pool with settings from the config."""
+
+    def __init__(self):
+        self.format = DEFAULT_FORMAT
+        self.quality = DEFAULT_QUALITY
+        self.max_side = DEFAULT_MAX_SIDE
+        self.workers = DEFAULT_WORKERS
+        self.processes = DEFAULT_PROCESSES
+        self.executor = None
+
+    def configure(self, config: dict):
+        """Reads the optional img_* delivery settings from the configuration dictionary."""
+        if not config:
+            return
+        fmt = str(config.get('img_format', self.format)).lower()
+        self.format = "jpeg" if fmt == "jpg" else fmt
+        if self.format not in EXTENSIONS:
+            log.warning("Unknown img_format '%s', falling back to %s.", fmt, DEFAULT_FORMAT)
+            self.format = DEFAULT_FORMAT
+        self.quality = config.get('img_quality', self.quality)
+        self.max_side = config.get('img_max_side', self.max_side)
+        self.workers = config.get('img_workers', self.workers)
+        self.processes = config.get('img_processes', self.processes)
+
+    def _executor(self):
+        if self.executor is None:
+            if self.processes:
+                # "spawn" keeps the workers free of the parent's threads and open sockets
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+                executor_queue_depth.track(lambda: len(self.executor._pending_work_items) if self.executor else 0,
+                                           pool="img")
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="img")
+                executor_queue_depth.track(self.executor._work_queue.qsize, pool="img")
+        return self.executor
+
+    def signature(self, full_fidelity: bool = False) -> tuple:
+        """The delivery settings that change the output bytes (used in cache keys)."""
+        if full_fidelity:
+            return ("png", 0, 0)
+        return (self.format, self.quality, self.max_side)
+
+    async def prepare(self, base64_data: str, full_fidelity: bool = False):
+        """Decodes (and unless full_fidelity, re-encodes) the image off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), prepare_image, base64_data, *self.signature(full_fidelity))
+
+    def close(self):
+        """Stops the workers (queued work is dropped) and waits for them, so none outlive the bot."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+# The pipeline shared by .img and /img on every client
+image_pipeline = ImagePipeline()
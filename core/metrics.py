@@ -0,0 +1,239 @@
+# In-process metrics with a Prometheus text-format endpoint.
+# Counters, gauges and histograms are plain Python objects updated on the event loop;
+# an optional tiny HTTP server (asyncio.start_server, no extra dependency) serves
+# them at /metrics when 'metrics_port' is set in config.json.
+
+import time
+import asyncio
+import logging
+import functools
+from core.log import get_logger, start_command, finish_command
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base class: a named family of time series keyed by label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> list:
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in self.series.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.callbacks = {} # label values -> zero-argument function read at scrape time
+
+    def set(self, value: float, **labels):
+        self.series[self._key(labels)] = value
+
+    def track(self, fn, **labels):
+        """Reads the value from fn() whenever the metrics are scraped."""
+        self.callbacks[self._key(labels)] = fn
+
+    def render(self) -> list:
+        values = dict(self.series)
+        for key, fn in list(self.callbacks.items()):
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+                break
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                bucket_labels = _labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Holds every metric and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- The bot's metrics ---
+handler_seconds = registry.histogram(
+    "ignitos_handler_seconds", "Time spent in a command or auto-reply handler.", ("command",))
+handler_errors = registry.counter(
+    "ignitos_handler_errors_total", "Handlers that raised an exception.", ("command",))
+upstream_seconds = registry.histogram(
+    "ignitos_upstream_seconds", "Latency of one upstream HTTP attempt (until response headers).", ("endpoint",))
+upstream_requests = registry.counter(
+    "ignitos_upstream_requests_total", "Upstream HTTP attempts by status code.", ("endpoint", "status"))
+upstream_retries = registry.counter(
+    "ignitos_upstream_retries_total", "Upstream attempts that were retried.", ("endpoint",))
+upstream_throttled = registry.counter(
+    "ignitos_upstream_429_total", "Upstream 429 (rate limited) responses.", ("endpoint",))
+executor_queue_depth = registry.gauge(
+    "ignitos_executor_queue_depth", "Work items waiting in a worker pool.", ("pool",))
+limiter_queue_depth = registry.gauge(
+    "ignitos_ratelimit_queue_depth", "Requests waiting for an upstream rate-limit token.", ("endpoint",))
+job_queue_depth = registry.gauge(
+    "ignitos_job_queue_depth", "Jobs in the durable job queue, by state.", ("state",))
+jobs_finished = registry.counter(
+    "ignitos_jobs_total", "Jobs that left the running state, by outcome.", ("kind", "outcome"))
+background_tasks = registry.gauge(
+    "ignitos_background_tasks", "Command bodies running in (or waiting for) a background slot.", ("state",))
+outbox_queue_depth = registry.gauge(
+    "ignitos_outbox_queue_depth", "Outgoing Telegram requests waiting in the outbox.")
+outbox_flood_waits = registry.counter(
+    "ignitos_outbox_flood_waits_total", "FloodWait errors returned by Telegram.")
+loop_lag_seconds = registry.histogram(
+    "ignitos_loop_lag_seconds", "How late the event loop ran the watchdog's timer.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+loop_stalls = registry.counter(
+    "ignitos_loop_stalls_total", "Event-loop stalls longer than the watchdog threshold.")
+auto_reply_messages = registry.counter(
+    "ignitos_auto_reply_messages_total", "Incoming private messages seen while away, by outcome.", ("outcome",))
+auto_replies_sent = registry.counter(
+    "ignitos_auto_replies_sent_total", "Auto-replies actually sent.")
+
+
+def timed(command: str, level: int = logging.INFO):
+    """
+    Decorator recording an async handler's latency (and failures) under the given command label,
+    and logging one structured record per call at level (see core/log.py).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            state = start_command(command, args)
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception:
+                handler_errors.inc(command=command)
+                raise
+            finally:
+                handler_seconds.observe(time.perf_counter() - started, command=command)
+                finish_command(state, outcome, level)
+        return wrapper
+    return decorator
+
+
+# --- HTTP endpoint ---
+
+async def _serve_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Drain the headers; the body (if any) is ignored
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(config: dict):
+    """Starts the /metrics endpoint if 'metrics_port' is configured. Returns the server or None."""
+    port = config.get('metrics_port')
+    if not port:
+        return None
+    host = config.get('metrics_host', DEFAULT_HOST)
+    server = await asyncio.start_server(_serve_client, host, port)
+    get_logger("metrics").info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,190 @@
+# Outbound message scheduler.
+# Every send, reply, edit and delete goes through one queue per chat, so:
+#   - each chat is held to Telegram's per-chat pace (about one message per second in
+#     private chats, twenty per minute in groups) and each client to a global rate;
+#   - a FloodWait pauses the chat and the client for the time Telegram asks for and the
+#     request is retried afterwards, instead of surfacing as an error;
+#   - an edit of a message that is still waiting in the queue replaces the older edit
+#     (streamed answers only ever need their latest text).
+# Callers await the result as if they had called Pyrogram directly.
+#
+#     sent = await outbox.reply_text(message, "🤖 Thinking...")
+#     await outbox.edit_text(client, sent.chat.id, sent.id, "Done")
+
+import asyncio
+from collections import OrderedDict, deque
+from pyrogram.errors import FloodWait
+from core.ratelimit import TokenBucket
+from core.metrics import outbox_queue_depth, outbox_flood_waits
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_CHAT_RATE = 1.0          # Messages per second in a private chat
+DEFAULT_GROUP_RATE = 20 / 60     # Messages per second in a group
+DEFAULT_CHAT_BURST = 3
+DEFAULT_GLOBAL_RATE = 25.0       # Messages per second per client, across all chats
+DEFAULT_GLOBAL_BURST = 30
+DEFAULT_MAX_FLOOD_WAIT = 300     # Longer FloodWaits are raised to the caller instead
+DEFAULT_MAX_CHATS = 5000         # Idle per-chat queues remembered (for their rate state)
+
+
+class Outgoing:
+    """One queued request: a coroutine factory, the future its caller awaits and an optional merge key."""
+
+    __slots__ = ("factory", "future", "merge_key")
+
+    def __init__(self, factory, future: asyncio.Future, merge_key=None):
+        self.factory = factory
+        self.future = future
+        self.merge_key = merge_key
+
+
+class ChatQueue:
+    """The pending requests of one chat, its rate bucket and the task sending them."""
+
+    def __init__(self, rate: float, burst: int):
+        self.pending = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.task = None
+
+
+class Outbox:
+    """Per-chat FIFO queues with per-chat and per-client rate limits and FloodWait handling."""
+
+    def __init__(self):
+        self.chat_rate = DEFAULT_CHAT_RATE
+        self.group_rate = DEFAULT_GROUP_RATE
+        self.chat_burst = DEFAULT_CHAT_BURST
+        self.global_rate = DEFAULT_GLOBAL_RATE
+        self.global_burst = DEFAULT_GLOBAL_BURST
+        self.max_flood_wait = DEFAULT_MAX_FLOOD_WAIT
+        self.max_chats = DEFAULT_MAX_CHATS
+        self.chats = OrderedDict() # (client name, chat id) -> ChatQueue
+        self.clients = {}          # client name -> TokenBucket
+        outbox_queue_depth.track(lambda: sum(len(queue.pending) for queue in self.chats.values()))
+
+    def configure(self, config: dict):
+        """Reads the optional outbox_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.chat_rate = float(config.get('outbox_chat_rate', self.chat_rate))
+        self.group_rate = float(config.get('outbox_group_rate', self.group_rate))
+        self.chat_burst = int(config.get('outbox_chat_burst', self.chat_burst))
+        self.global_rate = float(config.get('outbox_global_rate', self.global_rate))
+        self.global_burst = int(config.get('outbox_global_burst', self.global_burst))
+        self.max_flood_wait = float(config.get('outbox_max_flood_wait', self.max_flood_wait))
+        # Existing buckets keep their settings; new chats and clients use the new ones
+        self.clients.clear()
+
+    # --- Queues ---
+
+    def _client_bucket(self, client) -> TokenBucket:
+        bucket = self.clients.get(client.name)
+        if bucket is None:
+            bucket = self.clients[client.name] = TokenBucket(self.global_rate, self.global_burst)
+        return bucket
+
+    def _chat_queue(self, client, chat_id) -> ChatQueue:
+        key = (client.name, chat_id)
+        queue = self.chats.get(key)
+        if queue is None:
+            # Group and channel ids are negative
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            queue = self.chats[key] = ChatQueue(rate, self.chat_burst)
+            self._evict_idle()
+        else:
+            self.chats.move_to_end(key)
+        return queue
+
+    def _evict_idle(self):
+        if len(self.chats) <= self.max_chats:
+            return
+        for key in [key for key, queue in self.chats.items() if queue.task is None and not queue.pending]:
+            if len(self.chats) <= self.max_chats:
+                break
+            del self.chats[key]
+
+    def submit(self, client, chat_id, factory, merge_key=None) -> asyncio.Future:
+        """
+        Queues factory() (a coroutine function making one Telegram request) for the chat.
+        A request with the same merge_key that has not been sent yet is replaced, and
+        both callers get the result of the newer one. Returns a future with the result.
+        """
+        queue = self._chat_queue(client, chat_id)
+        if merge_key is not None:
+            for outgoing in queue.pending:
+                if outgoing.merge_key == merge_key and not outgoing.future.done():
+                    outgoing.factory = factory
+                    return outgoing.future
+        future = asyncio.get_running_loop().create_future()
+        queue.pending.append(Outgoing(factory, future, merge_key))
+        if queue.task is None:
+            queue.task = asyncio.create_task(self._drain(client, queue))
+        return future
+
+    async def _drain(self, client, queue: ChatQueue):
+        client_bucket = self._client_bucket(client)
+        try:
+            while queue.pending:
+                outgoing = queue.pending[0]
+                if outgoing.future.done():
+                    # The caller gave up (cancelled) before it was sent
+                    queue.pending.popleft()
+                    continue
+                wait = max(queue.bucket.delay(), client_bucket.delay())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                queue.bucket.take()
+                client_bucket.take()
+                queue.pending.popleft()
+                try:
+                    result = await outgoing.factory()
+                except FloodWait as e:
+                    outbox_flood_waits.inc()
+                    if e.value > self.max_flood_wait:
+                        if not outgoing.future.done():
+                            outgoing.future.set_exception(e)
+                        continue
+                    # Telegram asked us to slow down: hold this chat and the whole client, then retry
+                    queue.bucket.pause(e.value)
+                    client_bucket.pause(e.value)
+                    queue.pending.appendleft(outgoing)
+                    continue
+                except Exception as e:
+                    if not outgoing.future.done():
+                        outgoing.future.set_exception(e)
+                    continue
+                if not outgoing.future.done():
+                    outgoing.future.set_result(result)
+        finally:
+            queue.task = None
+
+    # --- Pyrogram-shaped helpers ---
+
+    async def send_message(self, client, chat_id, text: str, **kwargs):
+        return await self.submit(client, chat_id, lambda: client.send_message(chat_id, text, **kwargs))
+
+    async def reply_text(self, message, text: str, **kwargs):
+        """message.reply_text through the queue of the message's chat."""
+        return await self.submit(message._client, message.chat.id, lambda: message.reply_text(text, **kwargs))
+
+    async def edit_text(self, client, chat_id, message_id: int, text: str, **kwargs):
+        """Edits a message; a queued edit of the same message that has not gone out yet is superseded."""
+        future = self.submit(
+            client, chat_id,
+            lambda: client.edit_message_text(chat_id, message_id, text, **kwargs),
+            merge_key=("edit", message_id),
+        )
+        # Shielded: the future may be shared with the caller of the edit this one superseded
+        return await asyncio.shield(future)
+
+    async def delete(self, client, chat_id, message_ids):
+        return await self.submit(client, chat_id, lambda: client.delete_messages(chat_id, message_ids))
+
+    async def call(self, client, chat_id, factory):
+        """Any other request for the chat (send_photo, send_document, ...)."""
+        return await self.submit(client, chat_id, factory)
+
+
+# The outbound queue shared by every client in this process
+outbox = Outbox()
@@ -0,0 +1,358 @@
+# Plugin loader with lazy activation and startup profiling.
+# A plugin can declare the commands it handles in a module-level COMMANDS dict:
+#
+#     COMMANDS = {"user": ["ai", "ai!"], "bot": ["ai", "ai!"]}
+#
+# The loader reads that declaration straight from the source file (no import), registers
+# cheap stub routes with the client's command router (core/router.py), and only imports
+# the module and runs its setup() when one of its commands is first used. Plugins without
+# COMMANDS are loaded eagerly.
+# Plugins can also be reloaded in place (".reload <plugin>" or by watching the folder):
+# their old handlers are removed and setup() runs again while the clients stay connected.
+
+import os
+import ast
+import sys
+import time
+import asyncio
+import importlib
+from pyrogram import Client
+from core.router import Route, router_for
+from core.log import get_logger
+
+PLUGINS_DIR = "plugins"
+
+log = get_logger("plugins")
+
+
+def read_manifest(path: str):
+    """Returns the literal COMMANDS dict declared in a plugin file, or None."""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == "COMMANDS" for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    return None
+
+
+def command_guards(is_control_bot: bool) -> dict:
+    """The routing every plugin uses: '.cmd' from the owner, or '/cmd' in a private bot chat."""
+    if is_control_bot:
+        return {"prefixes": "/", "private": True}
+    return {"prefixes": ".", "me": True}
+
+
+def remove_entry(app: Client, entry: tuple):
+    """Unregisters a recorded (handler, group) pair: a router route or a plain Pyrogram handler."""
+    handler, group = entry
+    if isinstance(handler, Route):
+        router_for(app).remove(handler)
+    else:
+        app.remove_handler(handler, group)
+
+
+def describe_changes(old_names: list, new_names: list) -> str:
+    """Summarises which handler functions were replaced, added or removed by a reload."""
+    replaced = [name for name in new_names if name in old_names]
+    added = [name for name in new_names if name not in old_names]
+    removed = [name for name in old_names if name not in new_names]
+    parts = []
+    if replaced:
+        parts.append("replaced " + ", ".join(replaced))
+    if added:
+        parts.append("added " + ", ".join(added))
+    if removed:
+        parts.append("removed " + ", ".join(removed))
+    return "; ".join(parts) if parts else "no handlers (still lazy)"
+
+
+class PluginState:
+    """Everything the loader knows about one plugin."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.manifest = None
+        self.module = None
+        self.manifest_ms = 0.0
+        self.mtime = None
+        self.failed_mtime = None # mtime of a version that failed to reload (not retried until edited)
+        self.import_ms = None
+        self.setup_ms = {}   # client name -> milliseconds
+        self.handlers = {}   # client name -> [(route or handler, group), ...] registered by setup()
+        self.stubs = {}      # client name -> (stub route, None)
+        self.error = None
+
+
+class PluginLoader:
+    """Discovers plugins, activates them eagerly or on first use, and reports timings."""
+
+    def __init__(self, config: dict, plugins_dir: str = PLUGINS_DIR):
+        self.config = config
+        self.plugins_dir = plugins_dir
+        self.lazy = config.get('lazy_plugins', True)
+        self.plugins = {}
+        self.locks = {}
+        self.clients = {} # client name -> (app, is_control_bot, config passed to setup)
+        self.watch_task = None
+
+        if os.path.isdir(plugins_dir) and plugins_dir not in sys.path:
+            sys.path.insert(0, plugins_dir)
+
+    @staticmethod
+    def kind(is_control_bot: bool) -> str:
+        """The COMMANDS section that applies to a client."""
+        return "bot" if is_control_bot else "user"
+
+    def discover(self):
+        """Finds plugin files and reads their command declarations."""
+        for filename in sorted(os.listdir(self.plugins_dir)):
+            if not filename.endswith(".py") or filename.startswith("__"):
+                continue
+            name = filename[:-3]
+            if name in self.plugins:
+                continue
+            state = PluginState(name, os.path.join(self.plugins_dir, filename))
+            self._read_manifest(state)
+            self.plugins[name] = state
+
+    def _read_manifest(self, state: PluginState):
+        started = time.perf_counter()
+        state.mtime = os.path.getmtime(state.path)
+        try:
+            state.manifest = read_manifest(state.path)
+        except (SyntaxError, ValueError) as e:
+            state.manifest = None
+            log.warning("Could not read command declaration of plugin %s: %s", state.name, e)
+        state.manifest_ms = (time.perf_counter() - started) * 1000
+
+    # --- Import and setup ---
+
+    def _import(self, state: PluginState):
+        if state.module is None:
+            started = time.perf_counter()
+            state.module = importlib.import_module(state.name)
+            state.import_ms = (time.perf_counter() - started) * 1000
+        return state.module
+
+    def _setup(self, state: PluginState, app: Client, is_control_bot: bool):
+        """Runs setup() for one client, recording the handlers it registers."""
+        module = self._import(state)
+        if not hasattr(module, 'setup'):
+            raise AttributeError("'setup' function not found")
+
+        label = app.name
+        config = self.clients.get(label, (None, None, self.config))[2]
+        router = router_for(app) # Created before recording so its own handler is never recorded
+        recorded, routes = [], []
+        original_add_handler = app.add_handler
+
+        def recording_add_handler(handler, group: int = 0):
+            recorded.append((handler, group))
+            return original_add_handler(handler, group)
+
+        # Plugins register with the router; plain Pyrogram handlers are still supported
+        app.add_handler = recording_add_handler
+        router.recorder = routes
+        started = time.perf_counter()
+        try:
+            # Pass all three required arguments
+            module.setup(app, config, is_control_bot=is_control_bot)
+        finally:
+            del app.add_handler # Back to the class method
+            router.recorder = None
+        state.setup_ms[label] = (time.perf_counter() - started) * 1000
+        state.handlers[label] = [(route, None) for route in routes] + recorded
+
+    # --- Lazy activation ---
+
+    def _register_stub(self, state: PluginState, app: Client, is_control_bot: bool, commands: list):
+        label = app.name
+        router = router_for(app)
+
+        async def lazy_plugin_stub(client, message):
+            handlers = await self.activate(state.name, app, is_control_bot)
+            if label in state.stubs:
+                # Activation failed; the stub stays and the error was printed
+                return
+            # The stub route is gone, so routing the message again reaches the real command
+            if any(isinstance(handler, Route) for handler, _ in handlers):
+                await router.dispatch(client, message)
+                return
+            # Plain Pyrogram handlers only see the *next* update, so hand this one over directly
+            for handler, _ in handlers:
+                if await handler.check(client, message):
+                    await handler.callback(client, message)
+                    break
+
+        stub = router.add(commands, lazy_plugin_stub, **command_guards(is_control_bot))
+        state.stubs[label] = (stub, None)
+
+    async def activate(self, name: str, app: Client, is_control_bot: bool) -> list:
+        """Imports the plugin and runs its setup for this client (once). Returns its handlers."""
+        state = self.plugins[name]
+        label = app.name
+        lock = self.locks.setdefault((name, label), asyncio.Lock())
+        async with lock:
+            if label not in state.handlers:
+                try:
+                    self._setup(state, app, is_control_bot)
+                except Exception as e:
+                    state.error = str(e)
+                    log.error("Failed to activate plugin %s: %s", name, e)
+                    return []
+                log.info("Activated plugin %s on first use (%s): import %.1f ms, setup %.1f ms",
+                         name, label, state.import_ms, state.setup_ms[label])
+                stub = state.stubs.pop(label, None)
+                if stub:
+                    remove_entry(app, stub)
+        return state.handlers[label]
+
+    # --- Public API ---
+
+    def load(self, app: Client, is_control_bot: bool, config: dict = None):
+        """
+        Registers every plugin on one client, lazily where the plugin allows it.
+        `config` is what the plugins' setup() receives for this client (in
+        multi-account mode, that account's view of the configuration).
+        """
+        if not os.path.isdir(self.plugins_dir):
+            log.warning("No plugins directory found at '%s'. Please create a 'plugins' folder to add new features.",
+                        self.plugins_dir)
+            return
+
+        self.discover()
+        router_for(app)
+        self.clients[app.name] = (app, is_control_bot, config if config is not None else self.config)
+        for state in self.plugins.values():
+            self._attach(state, app, is_control_bot)
+
+    def _attach(self, state: PluginState, app: Client, is_control_bot: bool):
+        """Registers one plugin on one client: a stub if it can be lazy, otherwise setup()."""
+        commands = (state.manifest or {}).get(self.kind(is_control_bot))
+        if self.lazy and state.manifest is not None:
+            if commands:
+                self._register_stub(state, app, is_control_bot, commands)
+            # A declared plugin with no commands for this client has nothing to register
+            return
+        try:
+            self._setup(state, app, is_control_bot)
+            log.info("Loaded plugin: %s", state.name)
+        except Exception as e:
+            state.error = str(e)
+            log.error("Failed to load plugin %s: %s", state.name, e)
+
+    # --- Hot reload ---
+
+    async def reload(self, name: str) -> str:
+        """
+        Re-imports a plugin and swaps its handlers on every client without
+        reconnecting. Returns a short report of the handlers that changed.
+        """
+        state = self.plugins.get(name)
+        if state is None:
+            self.discover()
+            state = self.plugins.get(name)
+            if state is None:
+                return f"Unknown plugin: {name}"
+            for app, is_control_bot, _ in self.clients.values():
+                self._attach(state, app, is_control_bot)
+            return f"{name}: new plugin loaded"
+
+        started = time.perf_counter()
+        mtime = os.path.getmtime(state.path)
+        try:
+            # Parse first so a syntax error leaves the running version (handlers, stubs, manifest) untouched
+            manifest = read_manifest(state.path)
+            manifest_ms = (time.perf_counter() - started) * 1000
+            if state.module is not None:
+                state.module = importlib.reload(state.module)
+        except Exception as e:
+            state.failed_mtime = mtime
+            return f"{name}: reload failed, keeping the running version ({type(e).__name__}: {e})"
+
+        state.mtime, state.failed_mtime = mtime, None
+        state.manifest, state.manifest_ms = manifest, manifest_ms
+        state.error = None
+        lines = []
+        for label, (app, is_control_bot, _) in self.clients.items():
+            lock = self.locks.setdefault((name, label), asyncio.Lock())
+            async with lock:
+                old_handlers = state.handlers.pop(label, [])
+                old_names = [handler.callback.__name__ for handler, _ in old_handlers]
+                stub = state.stubs.pop(label, None)
+                for entry in old_handlers + ([stub] if stub else []):
+                    remove_entry(app, entry)
+                was_active = bool(old_handlers)
+
+                if was_active or not self.lazy or state.manifest is None:
+                    try:
+                        self._setup(state, app, is_control_bot)
+                    except Exception as e:
+                        state.error = str(e)
+                        lines.append(f"  {label}: setup failed ({e})")
+                        continue
+                else:
+                    self._attach(state, app, is_control_bot)
+                new_names = [handler.callback.__name__ for handler, _ in state.handlers.get(label, [])]
+            lines.append(f"  {label}: {describe_changes(old_names, new_names)}")
+
+        elapsed = (time.perf_counter() - started) * 1000
+        return "\n".join([f"{name}: reloaded in {elapsed:.1f} ms"] + lines)
+
+    def changed_plugins(self) -> list:
+        """Names of plugins whose file changed (or appeared) since it was last read."""
+        changed = []
+        for filename in sorted(os.listdir(self.plugins_dir)):
+            if not filename.endswith(".py") or filename.startswith("__"):
+                continue
+            name = filename[:-3]
+            state = self.plugins.get(name)
+            mtime = os.path.getmtime(state.path) if state is not None else None
+            if state is None or mtime not in (state.mtime, state.failed_mtime):
+                changed.append(name)
+        return changed
+
+    async def reload_changed(self) -> list:
+        """Reloads every plugin whose file changed. Returns the reports."""
+        return [await self.reload(name) for name in self.changed_plugins()]
+
+    def watch(self, interval: float = 2.0):
+        """Starts polling the plugins folder and reloads plugins when their file changes."""
+        async def watch_loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    for report in await self.reload_changed():
+                        log.info("Plugin auto-reload:\n%s", report)
+                except Exception as e:
+                    log.error("Plugin auto-reload failed: %s", e)
+
+        if self.watch_task is None:
+            self.watch_task = asyncio.create_task(watch_loop())
+
+    def stop_watching(self):
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+
+    def report(self) -> str:
+        """A startup table with the import and setup cost of each plugin."""
+        lines = ["Plugin startup report:"]
+        total = 0.0
+        for state in self.plugins.values():
+            if state.error:
+                lines.append(f"  {state.name:<12} failed: {state.error}")
+                continue
+            if state.import_ms is None:
+                stubs = ", ".join(sorted(state.stubs)) or "-"
+                lines.append(f"  {state.name:<12} lazy ({stubs})   manifest {state.manifest_ms:6.1f} ms")
+                total += state.manifest_ms
+                continue
+            setup_ms = sum(state.setup_ms.values())
+            lines.append(f"  {state.name:<12} eager        import {state.import_ms:6.1f} ms, setup {setup_ms:6.1f} ms")
+            total += state.import_ms + setup_ms
+        lines.append(f"  {'total':<12} {total:.1f} ms")
+        return "\n".join(lines)
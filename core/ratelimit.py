@@ -0,0 +1,157 @@
+# Global token-bucket rate limiter with a priority lane for upstream API calls.
+# Every Gemini/Imagen request takes a token from its endpoint's bucket before it
+# is sent. Waiters are served in priority order (owner commands first), and a
+# 429 pauses the whole endpoint for the server's Retry-After instead of letting
+# each caller hammer the API on its own schedule.
+
+import time
+import heapq
+import asyncio
+import itertools
+from core.metrics import limiter_queue_depth
+
+# --- Priorities (lower value is served first) ---
+PRIORITY_OWNER = 0 # .ai / .img typed by the account owner on the user bot
+PRIORITY_BOT = 1   # /ai / /img sent to the control bot
+
+# --- Default budgets per endpoint (overridable with the 'rate_limits' config key) ---
+DEFAULT_LIMITS = {
+    "gemini": {"rate": 1.0, "burst": 5},  # tokens per second, bucket capacity
+    "imagen": {"rate": 0.2, "burst": 2},
+}
+FALLBACK_LIMIT = {"rate": 1.0, "burst": 1}
+
+
+class TokenBucket:
+    """Classic token bucket that can also be paused after a rate-limit response."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token can be taken (0 when one is available now)."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Blocks the bucket for the given number of seconds and drains it."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class Lane:
+    """Waiting room and statistics for one endpoint."""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.waiters = [] # heap of (priority, sequence, future)
+        self.pump = None
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def depth(self) -> int:
+        return sum(1 for _, _, future in self.waiters if not future.done())
+
+
+class RateLimiter:
+    """Per-endpoint token buckets shared by every plugin and client."""
+
+    def __init__(self):
+        self.limits = {name: dict(limit) for name, limit in DEFAULT_LIMITS.items()}
+        self.lanes = {}
+        self.sequence = itertools.count()
+
+    def configure(self, config: dict):
+        """Applies the optional 'rate_limits' mapping: {"gemini": {"rate": 1, "burst": 5}}."""
+        if not config:
+            return
+        for name, limit in (config.get('rate_limits') or {}).items():
+            self.limits.setdefault(name, dict(FALLBACK_LIMIT)).update(limit)
+            if name in self.lanes:
+                bucket = self.lanes[name].bucket
+                bucket.rate = self.limits[name]['rate']
+                bucket.capacity = self.limits[name]['burst']
+
+    def _lane(self, endpoint: str) -> Lane:
+        lane = self.lanes.get(endpoint)
+        if lane is None:
+            limit = self.limits.get(endpoint, FALLBACK_LIMIT)
+            lane = self.lanes[endpoint] = Lane(endpoint, limit['rate'], limit['burst'])
+            limiter_queue_depth.track(lane.depth, endpoint=endpoint)
+        return lane
+
+    async def _run_pump(self, lane: Lane):
+        """Hands out tokens to waiters in priority order, sleeping while the bucket is empty."""
+        try:
+            while lane.waiters:
+                delay = lane.bucket.delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                _, _, future = heapq.heappop(lane.waiters)
+                if future.done():
+                    # The waiter was cancelled while queued
+                    continue
+                lane.bucket.take()
+                future.set_result(None)
+        finally:
+            lane.pump = None
+
+    async def acquire(self, endpoint: str, priority: int = PRIORITY_BOT):
+        """Waits (without blocking the loop) until the endpoint's budget allows a request."""
+        lane = self._lane(endpoint)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.waiters, (priority, next(self.sequence), future))
+        if lane.pump is None:
+            lane.pump = asyncio.create_task(self._run_pump(lane))
+
+        started = time.monotonic()
+        await future
+        waited = time.monotonic() - started
+        lane.granted += 1
+        lane.total_wait += waited
+        lane.max_wait = max(lane.max_wait, waited)
+
+    def penalize(self, endpoint: str, seconds: float):
+        """Pauses an endpoint after a 429 so every queued caller backs off together."""
+        lane = self._lane(endpoint)
+        lane.throttled += 1
+        lane.bucket.pause(seconds)
+
+    def stats(self) -> dict:
+        """Queue depth, wait times and budgets for every endpoint seen so far."""
+        return {
+            name: {
+                "rate": lane.bucket.rate,
+                "burst": lane.bucket.capacity,
+                "queue_depth": lane.depth(),
+                "granted": lane.granted,
+                "throttled": lane.throttled,
+                "avg_wait": lane.total_wait / lane.granted if lane.granted else 0.0,
+                "max_wait": lane.max_wait,
+            }
+            for name, lane in self.lanes.items()
+        }
+
+
+# The limiter shared by every plugin and client
+rate_limiter = RateLimiter()
@@ -0,0 +1,180 @@
+# Central command router: one Pyrogram handler per client.
+# Instead of every plugin adding its own `filters.command(...) & filters.me` handler
+# (each of which Pyrogram evaluates, with a regex per command, for every update), plugins
+# register their commands here. The router parses the prefix and command once and looks
+# the command up in a dict, then applies the guards stored with the route (sent by me,
+# private chat, incoming), so the cost per update does not grow with the number of
+# plugins. Messages that are not a matching command go to the fallback routes (auto_reply).
+# Routes added with background=True run as managed tasks (core/tasks.py), so slow command
+# bodies do not hold a Pyrogram dispatcher worker.
+#
+#     router = router_for(app)
+#
+#     @router.command(["ai", "ai!"], prefixes=".", me=True)
+#     async def user_bot_ai_command(client, message): ...
+
+import re
+import weakref
+from pyrogram import enums
+from pyrogram.handlers import MessageHandler
+from core.tasks import task_manager
+
+# Same argument splitting as filters.command: quoted strings or whitespace-separated words
+COMMAND_ARGS_RE = re.compile(r"([\"'])(.*?)(?<!\\)\1|(\S+)")
+
+
+def is_me(message) -> bool:
+    """filters.me: sent by this account."""
+    return bool(message.from_user and message.from_user.is_self or getattr(message, "outgoing", False))
+
+
+def is_private(message) -> bool:
+    """filters.private: a one-to-one chat."""
+    return bool(message.chat and message.chat.type in (enums.ChatType.PRIVATE, enums.ChatType.BOT))
+
+
+class Route:
+    """A registered callback and the guards a message has to pass to reach it."""
+
+    __slots__ = ("callback", "me", "private", "incoming", "background")
+
+    def __init__(self, callback, me: bool = None, private: bool = False, incoming: bool = False,
+                 background: bool = False):
+        self.callback = callback
+        self.me = me                 # True: only from me, False: never from me, None: anyone
+        self.private = private       # Only in private chats
+        self.incoming = incoming     # Only messages we received (not outgoing)
+        self.background = background # Run as a managed task instead of on the dispatcher worker
+
+    def allows(self, message) -> bool:
+        if self.me is not None and is_me(message) != self.me:
+            return False
+        if self.private and not is_private(message):
+            return False
+        if self.incoming and getattr(message, "outgoing", False):
+            return False
+        return True
+
+
+class RouterHandler(MessageHandler):
+    """The single Pyrogram handler of a client; it only claims updates the router can route."""
+
+    def __init__(self, router):
+        super().__init__(router.dispatch)
+        self.router = router
+
+    async def check(self, client, message) -> bool:
+        # Runs on the event loop (no executor hop like a plain sync filter). Pyrogram passes
+        # the same message object to dispatch, which picks up the match kept on it here
+        found = self.router.match(client, message)
+        message._route_match = found
+        return found[0] is not None
+
+
+class Router:
+    """Command table and fallback routes for one client."""
+
+    def __init__(self, app):
+        self.routes = {}     # prefix -> {command -> [Route, ...]}
+        self.fallbacks = []  # Routes tried when no command route took the message
+        self.recorder = None # The plugin loader collects the routes a plugin's setup() adds
+        self.handler = RouterHandler(self)
+        app.add_handler(self.handler, 0)
+
+    # --- Registration ---
+
+    def add(self, commands, callback, prefixes="/", me: bool = None, private: bool = False,
+            background: bool = False) -> Route:
+        """Routes one or more commands (under each prefix) to callback(client, message). Returns the route."""
+        commands = [commands] if isinstance(commands, str) else commands
+        prefixes = [prefixes] if isinstance(prefixes, str) else prefixes
+        route = Route(callback, me=me, private=private, background=background)
+        for prefix in prefixes:
+            table = self.routes.setdefault(prefix, {})
+            for command in commands:
+                table.setdefault(command.lower(), []).append(route)
+        if self.recorder is not None:
+            self.recorder.append(route)
+        return route
+
+    def command(self, commands, prefixes="/", me: bool = None, private: bool = False, background: bool = False):
+        """Decorator form of add()."""
+        def decorator(func):
+            self.add(commands, func, prefixes=prefixes, me=me, private=private, background=background)
+            return func
+        return decorator
+
+    def fallback(self, me: bool = None, private: bool = False, incoming: bool = False):
+        """Decorator for a route that receives any message no command route took."""
+        def decorator(func):
+            route = Route(func, me=me, private=private, incoming=incoming)
+            self.fallbacks.append(route)
+            if self.recorder is not None:
+                self.recorder.append(route)
+            return func
+        return decorator
+
+    def remove(self, route: Route):
+        """Removes a route from every command (or the fallbacks) it was registered for."""
+        if route in self.fallbacks:
+            self.fallbacks.remove(route)
+        for table in self.routes.values():
+            for command in [command for command, routes in table.items() if route in routes]:
+                table[command].remove(route)
+                if not table[command]:
+                    del table[command]
+
+    # --- Dispatch ---
+
+    def match(self, client, message):
+        """Returns (route, command, argument text) for a message, or (None, None, None)."""
+        text = message.text or message.caption
+        if text:
+            for prefix, table in self.routes.items():
+                if not text.startswith(prefix):
+                    continue
+                parts = text[len(prefix):].split(None, 1)
+                if not parts:
+                    continue
+                command = parts[0].lower()
+                if "@" in command:
+                    # "/cmd@botname" is only for us if botname is our username
+                    command, _, target = command.partition("@")
+                    username = (getattr(client.me, "username", None) or "").lower() if client.me else ""
+                    if target != username:
+                        continue
+                for route in table.get(command, ()):
+                    if route.allows(message):
+                        return route, command, parts[1] if len(parts) > 1 else ""
+        for route in self.fallbacks:
+            if route.allows(message):
+                return route, None, None
+        return None, None, None
+
+    async def dispatch(self, client, message):
+        """Runs the route that matches the message (sets message.command like filters.command)."""
+        found = message.__dict__.pop("_route_match", None)
+        route, command, arguments = found if found is not None else self.match(client, message)
+        if route is None:
+            return
+        if command is not None:
+            message.command = [command] + [
+                re.sub(r"\\([\"'])", r"\1", m.group(2) or m.group(3) or "")
+                for m in COMMAND_ARGS_RE.finditer(arguments)
+            ]
+        if route.background:
+            task_manager.spawn(route.callback(client, message), name=command or route.callback.__name__)
+            return
+        await route.callback(client, message)
+
+
+# One router per client object, created on first use
+_routers = weakref.WeakKeyDictionary()
+
+
+def router_for(app) -> Router:
+    """The router of a client (registers its Pyrogram handler the first time)."""
+    router = _routers.get(app)
+    if router is None:
+        router = _routers[app] = Router(app)
+    return router
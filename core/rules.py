@@ -0,0 +1,181 @@
+# Auto-reply rules: pick the away message by keyword, regex, sender or chat.
+# Rules live in the account's config as a list of dicts:
+#
+#     "auto_reply_rules": [
+#         {"id": 1, "type": "keyword", "pattern": "invoice", "reply": "Invoices go to billing@example.com"},
+#         {"id": 2, "type": "regex", "pattern": "\\bprice(s)?\\b", "reply": "See the price list in my bio."},
+#         {"id": 3, "type": "sender", "pattern": "@alice", "reply": "Hi Alice, back at 6."},
+#         {"id": 4, "type": "chat", "pattern": "123456789", "reply": "Got your message, I'll call you back."}
+#     ]
+#
+# They are compiled once (whenever the list changes) into dict lookups for chats, senders
+# and keywords (indexed by their first word, so matching costs one pass over the message
+# words however many keywords there are) and one combined regex for the regex rules.
+# Regexes that cannot be part of it are kept apart and tried one by one: those with numbered
+# backreferences (\1, their groups would be renumbered), inline global flags such as (?i)
+# (only allowed at the very start of a pattern) or a group name another rule already uses.
+# Precedence: chat, then sender, then keyword (earliest rule), then regex (leftmost match,
+# earliest rule on a tie).
+
+import re
+from core.log import get_logger
+
+RULE_TYPES = ("keyword", "regex", "sender", "chat")
+WORD_RE = re.compile(r"\w+")
+# A backslash followed by a group number, not itself escaped
+BACKREF_RE = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]")
+
+log = get_logger("rules")
+
+
+def words(text: str) -> list:
+    return WORD_RE.findall(text.casefold())
+
+
+def parse_rule(text: str) -> dict:
+    """
+    Parses '<type> <pattern> => <reply>' (the /addrule syntax) into a rule dict without an id.
+    Raises ValueError with a readable message for invalid input.
+    """
+    head, separator, reply = text.partition("=>")
+    parts = head.split(None, 1)
+    if not separator or len(parts) < 2 or not reply.strip():
+        raise ValueError("Use: `<keyword|regex|sender|chat> <pattern> => <reply>`")
+    rule_type, pattern = parts[0].lower(), parts[1].strip()
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"Unknown rule type '{rule_type}'. Use one of: {', '.join(RULE_TYPES)}.")
+    rule = {"type": rule_type, "pattern": pattern, "reply": reply.strip()}
+    check_rule(rule)
+    return rule
+
+
+def check_rule(rule: dict):
+    """Raises ValueError if the rule can never match."""
+    if rule["type"] == "regex":
+        try:
+            re.compile(rule["pattern"])
+        except re.error as e:
+            raise ValueError(f"Invalid regex: {e}")
+    elif rule["type"] == "keyword" and not words(rule["pattern"]):
+        raise ValueError("A keyword needs at least one word character.")
+    elif rule["type"] == "chat":
+        try:
+            int(rule["pattern"])
+        except ValueError:
+            raise ValueError("A chat rule needs the numeric chat id.")
+
+
+def format_rules(rules: list) -> str:
+    """Renders the rules as a short Markdown list for /rules."""
+    if not rules:
+        return "No auto-reply rules. Every message gets the offline message."
+    lines = ["**Auto-reply rules**"]
+    for rule in rules:
+        lines.append(f"`#{rule['id']}` {rule['type']} `{rule['pattern']}` → {rule['reply']}")
+    return "\n".join(lines)
+
+
+class RuleMatcher:
+    """The compiled form of one account's rules."""
+
+    def __init__(self):
+        self.source = None # The rule list the matcher was built from
+        self.chats = {}    # chat id -> reply
+        self.senders = {}  # user id or lowercase username -> reply
+        self.keywords = {} # first word -> [(words, rule index, reply), ...]
+        self.regex = None  # Combined pattern; group "r<n>" belongs to regex_replies[n]
+        self.regex_replies = [] # (rule index, reply) per group of the combined pattern
+        self.regex_list = [] # (pattern, rule index, reply) for the regexes tried one by one
+
+    def load(self, rules: list):
+        """Recompiles the matcher if the rules differ from the ones it was built from."""
+        rules = list(rules or [])
+        if rules == self.source:
+            return
+        chats, senders, keywords, patterns, replies, compiled, separate = {}, {}, {}, [], [], [], []
+        group_names = set() # Group names taken in the combined pattern
+        for index, rule in enumerate(rules):
+            rule_type, pattern, reply = rule.get("type"), str(rule.get("pattern", "")), rule.get("reply", "")
+            if rule_type == "chat":
+                try:
+                    chats.setdefault(int(pattern), reply)
+                except ValueError:
+                    continue
+            elif rule_type == "sender":
+                key = pattern.lstrip("@").lower()
+                senders.setdefault(int(key) if key.lstrip("-").isdigit() else key, reply)
+            elif rule_type == "keyword":
+                tokens = tuple(words(pattern))
+                if tokens:
+                    keywords.setdefault(tokens[0], []).append((tokens, index, reply))
+            elif rule_type == "regex":
+                try:
+                    entry = (re.compile(pattern, re.IGNORECASE), index, reply)
+                except re.error:
+                    continue
+                wrapped = f"(?P<r{len(replies)}>{pattern})"
+                try:
+                    names = set(re.compile(wrapped, re.IGNORECASE).groupindex)
+                except re.error:
+                    names = None # e.g. an inline global flag, which only works at the start
+                if names is None or names & group_names or (entry[0].groups and BACKREF_RE.search(pattern)):
+                    separate.append(entry)
+                    continue
+                group_names |= names
+                compiled.append(entry)
+                patterns.append(wrapped)
+                replies.append((index, reply))
+        regex = None
+        if patterns:
+            try:
+                regex = re.compile("|".join(patterns), re.IGNORECASE)
+                compiled = []
+            except re.error as e:
+                log.warning("Could not combine the regex rules, trying all of them one by one: %s", e)
+                replies = []
+        if separate:
+            log.warning(
+                "Regex rules %s cannot be combined with the others and are tried one by one",
+                ", ".join(f"#{rules[index].get('id', index + 1)}" for _, index, _ in separate)
+            )
+        self.chats, self.senders, self.keywords = chats, senders, keywords
+        self.regex, self.regex_replies = regex, replies
+        self.regex_list = sorted(compiled + separate, key=lambda entry: entry[1])
+        self.source = rules
+
+    def match(self, message):
+        """Returns the reply of the rule that matches the message, or None."""
+        if self.chats and message.chat:
+            reply = self.chats.get(message.chat.id)
+            if reply is not None:
+                return reply
+        user = message.from_user
+        if self.senders and user:
+            reply = self.senders.get(user.id)
+            username = getattr(user, "username", None)
+            if reply is None and username:
+                reply = self.senders.get(username.lower())
+            if reply is not None:
+                return reply
+        text = message.text or message.caption
+        if not text:
+            return None
+        if self.keywords:
+            found = None
+            tokens = words(text)
+            for position, token in enumerate(tokens):
+                for keyword, index, reply in self.keywords.get(token, ()):
+                    if tuple(tokens[position:position + len(keyword)]) == keyword and (found is None or index < found[0]):
+                        found = (index, reply)
+            if found is not None:
+                return found[1]
+        found = None # (start, rule index, reply)
+        if self.regex is not None:
+            m = self.regex.search(text)
+            if m:
+                found = (m.start(), *self.regex_replies[int(m.lastgroup[1:])])
+        for pattern, index, reply in self.regex_list:
+            m = pattern.search(text)
+            if m and (found is None or (m.start(), index) < found[:2]):
+                found = (m.start(), index, reply)
+        return found[2] if found else None
@@ -0,0 +1,111 @@
+# Runtime profiles: which event loop, crypto and JSON implementations the bot runs on.
+#   "default": the standard asyncio loop and the stdlib json module.
+#   "fast":    uvloop as the event loop and orjson for config.json and the Gemini
+#              payloads, each only if installed (pip install uvloop orjson); anything
+#              missing falls back to the default implementation.
+# TgCrypto is not switchable: Pyrogram uses it whenever it is installed and falls back
+# to pure-Python AES otherwise, so the self-check only reports (and, in the fast
+# profile, warns) which one is in use.
+# The profile comes from `runtime_profile` in config.json or the IGNITOS_PROFILE
+# environment variable, and must be activated before the event loop starts:
+#
+#     activate(select_profile(CONFIG_FILE))
+#     print(report())
+#     asyncio.run(main())
+
+import os
+import json
+import asyncio
+
+PROFILES = ("default", "fast")
+DEFAULT_PROFILE = "default"
+PROFILE_ENV = "IGNITOS_PROFILE"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# What activate() turned on (read by report())
+active = {"profile": DEFAULT_PROFILE, "uvloop": False, "orjson": False}
+
+
+# --- JSON (used by core/config.py and core/http.py) ---
+
+def json_dumps(data, indent: bool = False) -> str:
+    """Serializes data with the active JSON backend (indent=True for files people edit)."""
+    if active["orjson"]:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(data, option=option).decode()
+    return json.dumps(data, indent=4 if indent else None)
+
+
+def json_dumps_bytes(data) -> bytes:
+    """Compact serialization for request bodies (orjson produces bytes directly)."""
+    if active["orjson"]:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+def json_loads(data):
+    """Parses str or bytes with the active JSON backend."""
+    if active["orjson"]:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# --- Profiles ---
+
+def select_profile(config_path: str = None) -> str:
+    """The requested profile: IGNITOS_PROFILE, else runtime_profile in the config file, else 'default'."""
+    profile = os.environ.get(PROFILE_ENV)
+    if not profile and config_path and os.path.exists(config_path):
+        try:
+            with open(config_path, 'r') as f:
+                profile = json.load(f).get('runtime_profile')
+        except (OSError, ValueError, AttributeError):
+            profile = None
+    return profile if profile in PROFILES else DEFAULT_PROFILE
+
+
+def activate(profile: str = DEFAULT_PROFILE):
+    """Switches the event loop policy and JSON backend for the profile. Call before asyncio.run()."""
+    fast = profile == "fast"
+    active["profile"] = profile if profile in PROFILES else DEFAULT_PROFILE
+    active["uvloop"] = fast and uvloop is not None
+    active["orjson"] = fast and orjson is not None
+    if active["uvloop"]:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        asyncio.set_event_loop_policy(None)
+
+
+def tgcrypto_active() -> bool:
+    """True if Pyrogram's AES runs on TgCrypto rather than the pure-Python fallback."""
+    # pyrogram.crypto.aes uses TgCrypto exactly when this import succeeds
+    try:
+        import tgcrypto
+    except ImportError:
+        return False
+    return True
+
+
+def report() -> str:
+    """The startup self-check: which accelerations are active and which fallbacks are in use."""
+    fast = active["profile"] == "fast"
+    missing = lambda package: f" ({package} is not installed)" if fast else ""
+    tgcrypto = tgcrypto_active()
+    lines = [
+        f"Runtime profile: {active['profile']}",
+        f"  loop     uvloop {uvloop.__version__}" if active["uvloop"] else f"  loop     asyncio{missing('uvloop')}",
+        "  crypto   TgCrypto" if tgcrypto else "  crypto   pure-Python AES (pip install TgCrypto)",
+        f"  json     orjson {orjson.__version__}" if active["orjson"] else f"  json     stdlib json{missing('orjson')}",
+    ]
+    if fast and not tgcrypto:
+        lines.append("  Warning: the fast profile is running without TgCrypto; Telegram traffic is encrypted in pure Python.")
+    return "\n".join(lines)
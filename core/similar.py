@@ -0,0 +1,194 @@
+# Near-duplicate prompt index for .ai answers (the similarity tier after the exact cache).
+# The exact response cache only matches prompts that are equal after collapsing case and
+# whitespace. This index also matches rewordings such as "capital of France?" and
+# "what's the capital of france": prompts are reduced to their content words, cut into
+# character 3-grams and summarized by a MinHash signature. Locality-sensitive hashing
+# (signature bands as dict keys) finds stored prompts that share a band, and only the few
+# sharing the most bands are compared exactly (Jaccard similarity of their 3-gram sets).
+# 3-grams ignore word order, so a candidate is only reused if it also asks the same thing
+# in the same order: its word pairs must overlap (ORDER_THRESHOLD) and its numbers,
+# operators, negations, past/future tense words and personal pronouns must be exactly the
+# same ("2+2" is not "2*2", "who is" is not "who was", "USD to EUR" is not "EUR to USD").
+# Present-tense helpers (is, do, has) and "me" are the unmarked case and may differ, so
+# "What is the capital of France?" still reuses "capital of France?".
+# A lookup is a handful of dict probes however many prompts are stored, all in memory.
+# Entries are kept for `ai_cache_ttl` like the exact cache, least recently used out first.
+
+import re
+import time
+import heapq
+import random
+from collections import Counter, OrderedDict
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_THRESHOLD = 0.8    # Jaccard similarity of the 3-gram sets needed to reuse an answer
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_TTL = 24 * 60 * 60
+
+NGRAM = 3
+BANDS = 10 # Signature of BANDS * ROWS MinHash values; prompts sharing a band are candidates
+ROWS = 5
+MAX_CANDIDATES = 8 # Candidates sharing the most bands that are compared exactly
+MAX_SIGNATURE_GRAMS = 48 # The signature is taken over the 3-grams with the smallest hashes
+ORDER_THRESHOLD = 0.5    # Jaccard similarity of the word pairs (in order) needed as well
+HASH_MASK = (1 << 64) - 1
+# One 64-bit hash per n-gram, XORed with a fixed mask per signature position
+MASKS = [random.Random(1009 + i).getrandbits(64) for i in range(BANDS * ROWS)]
+
+# Words, and the operator symbols that change what a question asks
+TOKEN_RE = re.compile(r"\w+|[-+*/^=<>%×÷]")
+# Filler that changes the wording of a question but not what is asked
+STOPWORDS = frozenset(
+    "a an the are be what whats s of to in on at for please tell "
+    "can could would about give show explain".split()
+)
+# Tokens that must be the same, in the same order, for two prompts to ask the same thing
+# (with numbers and operators)
+KEYWORDS = frozenset(
+    "was were will did had i you my your we us our he she they them not no never".split()
+)
+
+
+def content_words(prompt: str) -> list:
+    words = TOKEN_RE.findall(prompt.casefold())
+    kept = [word for word in words if word not in STOPWORDS]
+    # A prompt made only of filler words is compared as written
+    return kept or words
+
+
+def key_tokens(words: list) -> tuple:
+    """Numbers, operators and the KEYWORDS of a prompt, in order."""
+    return tuple(word for word in words if word in KEYWORDS or not word.isalpha())
+
+
+def word_pairs(words: list) -> frozenset:
+    """Consecutive word pairs (the word itself for a one-word prompt): sensitive to word order."""
+    if len(words) < 2:
+        return frozenset(words)
+    return frozenset(zip(words, words[1:]))
+
+
+def ngrams(words: list) -> frozenset:
+    """Character 3-grams of the prompt's content words (word boundaries included)."""
+    text = f" {' '.join(words)} "
+    if len(text) <= NGRAM:
+        return frozenset()
+    return frozenset(text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def signature(grams: frozenset) -> tuple:
+    # Long prompts are summarized by a fixed-size sample (the same grams for the same
+    # text, so near-duplicates still share most of it); the exact check uses all grams
+    hashes = heapq.nsmallest(MAX_SIGNATURE_GRAMS, [hash(gram) & HASH_MASK for gram in grams])
+    return tuple(min(map(mask.__xor__, hashes)) for mask in MASKS)
+
+
+def bands(scope: str, sig: tuple) -> list:
+    return [(scope, band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class Entry:
+    """A stored prompt, its 3-grams, word pairs, key tokens, LSH bucket keys and answer."""
+
+    __slots__ = ("prompt", "grams", "pairs", "key_tokens", "keys", "value", "expires_at")
+
+    def __init__(self, prompt: str, words: list, grams: frozenset, keys: list, value, expires_at: float):
+        self.prompt = prompt
+        self.grams = grams
+        self.pairs = word_pairs(words)
+        self.key_tokens = key_tokens(words)
+        self.keys = keys
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SimilarityIndex:
+    """MinHash/LSH index of recent prompts and their answers."""
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = DEFAULT_THRESHOLD
+        self.max_entries = DEFAULT_MAX_ENTRIES
+        self.ttl = DEFAULT_TTL
+        self.entries = OrderedDict() # id -> Entry, least recently used first
+        self.buckets = {}            # (scope, band, rows) -> {entry id, ...}
+        self.next_id = 0
+
+    def configure(self, config: dict):
+        """Reads the optional ai_similar_* settings (and ai_cache_ttl) from the configuration dictionary."""
+        if not config:
+            return
+        self.enabled = bool(config.get('ai_similar', self.enabled))
+        self.threshold = float(config.get('ai_similar_threshold', self.threshold))
+        self.max_entries = max(1, int(config.get('ai_similar_size', self.max_entries)))
+        self.ttl = config.get('ai_cache_ttl', self.ttl)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+
+    def _drop(self, entry_id: int):
+        entry = self.entries.pop(entry_id)
+        for key in entry.keys:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def lookup(self, prompt: str, scope: str = ""):
+        """
+        Returns (value, stored prompt, similarity) of the most similar stored prompt
+        at or above the threshold, or None. scope separates answers that are not
+        interchangeable (model, system instruction, search on or off).
+        """
+        if not self.enabled or not self.entries:
+            return None
+        words = content_words(prompt)
+        grams = ngrams(words)
+        if not grams:
+            return None
+        pairs, keys = word_pairs(words), key_tokens(words)
+        now = time.time()
+        shared = Counter()
+        for key in bands(scope, signature(grams)):
+            shared.update(self.buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for entry_id, _ in shared.most_common(MAX_CANDIDATES):
+            entry = self.entries[entry_id]
+            if entry.expires_at <= now:
+                self._drop(entry_id)
+                continue
+            if entry.key_tokens != keys or jaccard(pairs, entry.pairs) < ORDER_THRESHOLD:
+                continue
+            score = jaccard(grams, entry.grams)
+            if score >= best_score:
+                best, best_score = entry_id, score
+        if best is None:
+            return None
+        self.entries.move_to_end(best)
+        entry = self.entries[best]
+        return entry.value, entry.prompt, best_score
+
+    def add(self, prompt: str, value, scope: str = ""):
+        """Stores the answer to a prompt (evicting the least recently used entry when full)."""
+        if not self.enabled:
+            return
+        words = content_words(prompt)
+        grams = ngrams(words)
+        if not grams:
+            return
+        entry_id = self.next_id
+        self.next_id += 1
+        keys = bands(scope, signature(grams))
+        self.entries[entry_id] = Entry(prompt, words, grams, keys, value, time.time() + self.ttl)
+        for key in keys:
+            self.buckets.setdefault(key, set()).add(entry_id)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+
+
+# The index shared by .ai and /ai on every client
+similar_prompts = SimilarityIndex()
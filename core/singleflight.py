@@ -0,0 +1,39 @@
+# Single-flight deduplication of identical in-flight requests.
+# The first caller for a key starts the work; every concurrent caller with the
+# same key awaits that one result instead of issuing its own upstream request.
+
+import asyncio
+from core.metrics import registry
+
+singleflight_calls = registry.counter(
+    "ignitos_singleflight_calls_total", "Calls through a single-flight group, by role.", ("group", "role"))
+
+
+class SingleFlight:
+    """Shares one in-flight coroutine per key between all concurrent callers."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = {} # key -> task running the shared work
+
+    async def do(self, key, fn):
+        """
+        Runs fn() (a zero-argument coroutine function) unless a call with the same key
+        is already running, in which case its result is awaited instead. The shared
+        work is shielded, so one waiter being cancelled never cancels it for the others.
+        """
+        task = self.calls.get(key)
+        if task is not None:
+            singleflight_calls.inc(group=self.name, role="shared")
+            return await asyncio.shield(task)
+
+        singleflight_calls.inc(group=self.name, role="leader")
+        task = asyncio.ensure_future(fn())
+        self.calls[key] = task
+
+        def forget(finished):
+            if self.calls.get(key) is finished:
+                del self.calls[key]
+
+        task.add_done_callback(forget)
+        return await asyncio.shield(task)
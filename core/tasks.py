@@ -0,0 +1,75 @@
+# Managed background tasks for command bodies.
+# Pyrogram runs handlers on a fixed number of dispatcher workers; a handler that awaits
+# a slow call keeps its worker busy, and /online, .ping or auto-replies queue behind it.
+# Routes registered with background=True (see core/router.py) are started here instead:
+# the handler returns at once, at most `task_concurrency` bodies run at the same time
+# (the rest wait for a slot without holding a worker), and everything still running is
+# cancelled on shutdown.
+
+import asyncio
+from core.metrics import background_tasks
+from core.log import get_logger
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_CONCURRENCY = 16
+
+log = get_logger("tasks")
+
+
+class TaskManager:
+    """Starts coroutines as tracked tasks with a cap on how many run at once."""
+
+    def __init__(self):
+        self.concurrency = DEFAULT_CONCURRENCY
+        self.slots = None
+        self.tasks = set()
+        self.active = 0
+        background_tasks.track(lambda: self.active, state="running")
+        background_tasks.track(lambda: len(self.tasks) - self.active, state="waiting")
+
+    def configure(self, config: dict):
+        """Reads the optional task_concurrency setting from the configuration dictionary."""
+        if not config:
+            return
+        concurrency = max(1, int(config.get('task_concurrency', self.concurrency)))
+        if concurrency != self.concurrency:
+            # Tasks already waiting keep the old semaphore; new ones use the new cap
+            self.concurrency = concurrency
+            self.slots = None
+
+    def spawn(self, coro, name: str = None) -> asyncio.Task:
+        """Runs coro in the background once a slot is free. Returns the task."""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        task = asyncio.create_task(self._run(coro, self.slots), name=name)
+        self.tasks.add(task)
+        task.add_done_callback(lambda task: self._done(task, coro))
+        return task
+
+    async def _run(self, coro, slots: asyncio.Semaphore):
+        async with slots:
+            self.active += 1
+            try:
+                return await coro
+            finally:
+                self.active -= 1
+
+    def _done(self, task: asyncio.Task, coro):
+        self.tasks.discard(task)
+        # Close the coroutine in case it never started (cancelled while waiting for a slot)
+        coro.close()
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            log.error("Background task %s failed: %s: %s", task.get_name(), type(e).__name__, e)
+
+    async def shutdown(self, timeout: float = 5.0):
+        """Cancels every background task and waits (up to timeout) for them to finish."""
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+
+# The task manager shared by every client in this process
+task_manager = TaskManager()
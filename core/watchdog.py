@@ -0,0 +1,136 @@
+# Event-loop lag monitor.
+# A sampler task sleeps for `watchdog_interval` and measures how late it wakes up:
+# that delay is the time the loop spent running something else without yielding.
+# The samples feed a histogram (ignitos_loop_lag_seconds) and the percentiles shown
+# by .health. Since a blocked loop cannot report on itself, a daemon thread watches
+# the sampler's heartbeat; when it is older than `watchdog_threshold`, the thread
+# takes the loop thread's current stack (sys._current_frames) — i.e. the code that
+# is blocking right now — and keeps the last few for .health and the log.
+# Cost: one timer wakeup per interval on the loop and one check per half-threshold
+# in the thread, so it can stay on in production.
+
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from core.metrics import loop_lag_seconds, loop_stalls
+from core.log import get_logger
+
+# --- Defaults (overridable from config.json) ---
+DEFAULT_INTERVAL = 0.1   # Seconds between lag samples
+DEFAULT_THRESHOLD = 0.25 # Lag (seconds) that counts as a stall and captures a stack
+DEFAULT_SAMPLES = 3000   # Recent samples kept for the percentiles (about five minutes)
+DEFAULT_STALLS = 5       # Captured stalls kept for .health
+STACK_DEPTH = 12         # Innermost frames kept per captured stack
+
+log = get_logger("watchdog")
+
+
+class Stall:
+    """One detected stall: when it started, how long it lasted and where the loop was stuck."""
+
+    __slots__ = ("started", "lag", "stack")
+
+    def __init__(self, started: float, lag: float, stack: str):
+        self.started = started # Wall-clock time
+        self.lag = lag         # Seconds; updated once the loop runs again
+        self.stack = stack
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and captures the stack of whatever blocks the loop."""
+
+    def __init__(self):
+        self.enabled = True
+        self.interval = DEFAULT_INTERVAL
+        self.threshold = DEFAULT_THRESHOLD
+        self.samples = deque(maxlen=DEFAULT_SAMPLES)
+        self.stalls = deque(maxlen=DEFAULT_STALLS)
+        self.heartbeat = time.monotonic()
+        self.loop_thread = None
+        self.sampler = None
+        self.monitor = None
+        self.stopping = threading.Event()
+        self.current = None # The stall in progress (set by the monitor thread)
+
+    def configure(self, config: dict):
+        """Reads the optional watchdog_* settings from the configuration dictionary."""
+        if not config:
+            return
+        self.enabled = bool(config.get('watchdog', self.enabled))
+        self.interval = max(0.01, float(config.get('watchdog_interval', self.interval)))
+        self.threshold = max(self.interval, float(config.get('watchdog_threshold', self.threshold)))
+
+    # --- Loop side ---
+
+    async def start(self):
+        """Starts the sampler on the running loop and the monitor thread (idempotent)."""
+        if not self.enabled or self.sampler is not None:
+            return
+        self.loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopping.clear()
+        self.sampler = asyncio.create_task(self._sample())
+        self.monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.monitor.start()
+
+    async def _sample(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - before - self.interval)
+            self.heartbeat = now
+            self.samples.append(lag)
+            loop_lag_seconds.observe(lag)
+            stall = self.current
+            if stall is not None:
+                # The loop is running again: record how long the stall really was
+                self.current = None
+                stall.lag = lag
+                loop_stalls.inc()
+                log.warning("Event loop blocked for %.0f ms in:\n%s", lag * 1000, stall.stack)
+
+    async def stop(self):
+        self.stopping.set()
+        if self.sampler is not None:
+            self.sampler.cancel()
+            await asyncio.gather(self.sampler, return_exceptions=True)
+            self.sampler = None
+        if self.monitor is not None:
+            await asyncio.to_thread(self.monitor.join, 1.0)
+            self.monitor = None
+
+    # --- Monitor thread ---
+
+    def _watch(self):
+        seen = None # Heartbeat of the stall already captured
+        while not self.stopping.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            overdue = time.monotonic() - heartbeat - self.interval
+            if overdue < self.threshold or heartbeat == seen:
+                continue
+            seen = heartbeat
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+            stall = Stall(time.time() - overdue, overdue, stack)
+            self.stalls.append(stall)
+            self.current = stall
+
+    # --- Reporting ---
+
+    def percentiles(self) -> dict:
+        """p50/p90/p99/max of the recent lag samples, in seconds (empty before the first sample)."""
+        if not self.samples:
+            return {}
+        ordered = sorted(self.samples)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1]}
+
+
+# The watchdog of this process's event loop
+watchdog = LoopWatchdog()
@@ -1,20 +1,38 @@
 # This script creates a Telegram self-bot that replies when you're away.
 # The initial setup and remote control are handled via a separate BotFather bot.
 
-import os
 import sys
-import json
 import asyncio
+import logging
 from pyrogram import Client, filters, idle
 from pyrogram.types import Message
 import getpass # Using getpass to hide sensitive input
-import importlib
 import time # Needed for the ping plugin if loaded
+from core.http import http_client
+from core.ratelimit import rate_limiter
+from core.autoreply import AutoReplyScheduler
+from core.rules import RuleMatcher, parse_rule, format_rules
+from core.digest import AwayLog, log_path, send_away_digest
+from core.config import ConfigStore, AccountConfig, account_configs
+from core.plugins import PluginLoader
+from core.jobs import job_queue
+from core.router import router_for
+from core.tasks import task_manager
+from core.outbox import outbox
+from core.metrics import timed, start_metrics_server
+from core.watchdog import watchdog
+from core.media import image_pipeline
+from core.cache import response_cache
+from core.imagecache import image_cache
+from core import runtime
+from core.log import get_logger, log_system
 
 # File path for the configuration file
 CONFIG_FILE = 'config.json'
 SESSION_NAME = 'user_bot_session'
 
+log = get_logger("main")
+
 # --- Custom Exception for Clean Exit ---
 class SetupCompleteError(Exception):
     """Custom exception to signal that setup is complete and the script should exit."""
@@ -22,18 +40,20 @@ class SetupCompleteError(Exception):
 
 # --- Configuration & Setup Logic ---
 
-def save_config(config_dict: dict):
-    """Saves the provided configuration dictionary to the JSON file."""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config_dict, f, indent=4)
+async def save_config(config_dict: dict):
+    """
+    Saves the configuration and waits until it is on disk (used by the setup steps).
+    At runtime, assigning to a ConfigStore key is enough: writes are batched and
+    done atomically off the event loop.
+    """
+    store = config_dict if isinstance(config_dict, ConfigStore) else ConfigStore(CONFIG_FILE, config_dict)
+    store.save()
+    await store.flush()
     print("Configuration saved successfully!")
 
 def load_config():
-    """Loads the configuration from the JSON file."""
-    if not os.path.exists(CONFIG_FILE):
-        return None
-    with open(CONFIG_FILE, 'r') as f:
-        return json.load(f)
+    """Loads the configuration from the JSON file into a ConfigStore."""
+    return ConfigStore.load(CONFIG_FILE)
 
 # --- BotFather Bot for Initial Setup ---
 
@@ -102,7 +122,7 @@ Once you have them, send me a message in the following format:
                 'gemini_api_key': None,
                 'bot_token': setup_app.bot_token # Save the bot token collected earlier
             }
-            save_config(initial_config)
+            await save_config(initial_config)
             
             await message.reply_text("Credentials saved successfully! The bot is now configured.")
             await message.reply_text("Please restart the main script to start your auto-reply bot.")
@@ -143,7 +163,7 @@ async def setup_user_session():
             
             # Update and save the entire configuration dictionary
             config['session_string'] = session_string
-            save_config(config)
+            await save_config(config)
             print("Session string exported and saved successfully!")
             
     except Exception as e:
@@ -151,26 +171,210 @@ async def setup_user_session():
         sys.exit(1)
 
 # Function to load plugins from the 'plugins' folder
-def load_plugins(app: Client, config: dict, is_control_bot: bool):
-    plugins_dir = "plugins"
-    if os.path.exists(plugins_dir) and os.path.isdir(plugins_dir):
-        sys.path.insert(0, plugins_dir)
-        for filename in os.listdir(plugins_dir):
-            if filename.endswith(".py") and not filename.startswith("__"):
-                try:
-                    module_name = filename[:-3]
-                    module = importlib.import_module(module_name)
-                    if hasattr(module, 'setup'):
-                        # Pass all three required arguments
-                        module.setup(app, config, is_control_bot=is_control_bot) 
-                        print(f"Loaded plugin: {module_name}")
-                    else:
-                        print(f"Skipping plugin {module_name}: 'setup' function not found.")
-                except Exception as e:
-                    print(f"Failed to load plugin {filename}: {e}")
-    else:
-        print(f"No plugins directory found at '{plugins_dir}'.")
-        print("Please create a 'plugins' folder to add new features.")
+def load_plugins(loader: PluginLoader, app: Client, is_control_bot: bool, config: dict = None):
+    """
+    Registers the plugins on one client. Plugins that declare their COMMANDS are
+    only imported when one of those commands is first used; the rest load now.
+    """
+    loader.load(app, is_control_bot=is_control_bot, config=config)
+    # Queued jobs are delivered through the client that received the command
+    job_queue.attach(app, config if config is not None else loader.config)
+
+async def resume_jobs(loader: PluginLoader):
+    """
+    Requeues jobs left over from the last run and activates the plugins that
+    run them (lazy plugins register their job runners in setup()), then starts
+    the job dispatcher.
+    """
+    for kind, client_name in await job_queue.pending():
+        if kind in loader.plugins and client_name in loader.clients:
+            app, is_control_bot, _ = loader.clients[client_name]
+            await loader.activate(kind, app, is_control_bot)
+        else:
+            log.warning("Queued '%s' jobs for '%s' will wait: no such plugin or client in this run.", kind, client_name)
+    await job_queue.start()
+
+# --- Accounts ---
+
+def worker_options(config: dict, key: str) -> dict:
+    """
+    Client keyword arguments for the number of Pyrogram dispatcher workers
+    ('user_workers' / 'bot_workers', settable per account). Pyrogram's default
+    is used when the key is missing.
+    """
+    workers = config.get(key)
+    return {"workers": max(1, int(workers))} if workers else {}
+
+class Account:
+    """The Telegram clients and away state of one account. Everything else is shared."""
+
+    def __init__(self, config: AccountConfig, first: bool = True):
+        self.config = config
+        self.name = config.name
+        # The first account keeps the classic session names so existing caches stay valid
+        suffix = "" if first else f"_{self.name}"
+
+        # Initialize the user bot client using the saved session string
+        self.user_app = Client(f"{SESSION_NAME}{suffix}", session_string=config['session_string'],
+                               **worker_options(config, 'user_workers'))
+
+        # Initialize the BotFather client using the API key and bot token from config (if available)
+        bot_app_token = config.get('bot_token')
+        if bot_app_token:
+            # The bot client runs alongside the user bot
+            self.bot_app = Client(f"control_bot{suffix}",
+                                  bot_token=bot_app_token,
+                                  api_id=config['api_id'],
+                                  api_hash=config['api_hash'],
+                                  **worker_options(config, 'bot_workers'))
+            log.info("[%s] Control Bot Client initialized.", self.name)
+        else:
+            self.bot_app = None
+            log.info("[%s] Control Bot Token not found. Only user-bot commands (.commands) will work.", self.name)
+
+        # One pending reply per chat, with a per-peer cooldown
+        self.auto_replies = AutoReplyScheduler()
+        # Keyword/regex/sender/chat rules that pick the reply (recompiled only when they change)
+        self.rules = RuleMatcher()
+        # Private messages received while away, summarized on /online
+        self.away_log = AwayLog(log_path(config, suffix))
+        self.configure()
+
+    def configure(self):
+        self.auto_replies.configure(self.config)
+        self.rules.load(self.config.get('auto_reply_rules'))
+
+    @property
+    def clients(self) -> list:
+        return [self.user_app] + ([self.bot_app] if self.bot_app else [])
+
+
+# --- Core command handlers (only for the user bot) ---
+
+def register_core_handlers(account: Account, plugin_loader: PluginLoader):
+    """Registers the away/online/editoff/rules/reload commands and the auto-reply on an account's user client."""
+    user_app = account.user_app
+    config = account.config
+    auto_replies = account.auto_replies
+    rules = account.rules
+    away_log = account.away_log
+    # Registered after the plugins, so plugin commands are routed first (as before)
+    router = router_for(user_app)
+
+    @router.command("editoff", me=True)
+    async def edit_offline_message(client, message: Message):
+        """Handles the /editoff command to update the offline message."""
+        try:
+            new_message = message.text.split(" ", 1)[1].strip()
+            # The store writes the change atomically in the background
+            config['offline_message'] = new_message
+            await outbox.reply_text(message, f"Offline message updated successfully to: \n`{new_message}`")
+        except IndexError:
+            await outbox.reply_text(message, "Please provide a new message after the /editoff command.\nExample: `/editoff I will reply later.`")
+        except Exception as e:
+            await outbox.reply_text(message, f"An error occurred: {e}")
+
+    @router.command("addrule", me=True)
+    async def add_rule(client, message: Message):
+        """Adds an auto-reply rule: /addrule <keyword|regex|sender|chat> <pattern> => <reply>"""
+        parts = message.text.split(None, 1)
+        try:
+            rule = parse_rule(parts[1] if len(parts) > 1 else "")
+        except ValueError as e:
+            await outbox.reply_text(message, f"❌ {e}\nExample: `/addrule keyword invoice => Please email billing@example.com`")
+            return
+        current = list(config.get('auto_reply_rules') or [])
+        rule = {"id": max((r['id'] for r in current), default=0) + 1, **rule}
+        # Assigning a new list saves it and recompiles the matcher (see the subscription in main)
+        config['auto_reply_rules'] = current + [rule]
+        await outbox.reply_text(message, f"✅ Added rule `#{rule['id']}`.")
+
+    @router.command("delrule", me=True)
+    async def delete_rule(client, message: Message):
+        """Deletes an auto-reply rule by its id: /delrule <id>"""
+        parts = message.text.split()
+        current = list(config.get('auto_reply_rules') or [])
+        remaining = [r for r in current if len(parts) < 2 or str(r['id']) != parts[1].lstrip("#")]
+        if len(parts) < 2 or len(remaining) == len(current):
+            await outbox.reply_text(message, "Please give the id of an existing rule (see /rules).\nExample: `/delrule 2`")
+            return
+        config['auto_reply_rules'] = remaining
+        await outbox.reply_text(message, f"🗑 Deleted rule `#{parts[1].lstrip('#')}`.")
+
+    @router.command("rules", me=True)
+    async def list_rules(client, message: Message):
+        await outbox.reply_text(message, format_rules(config.get('auto_reply_rules') or []))
+
+    @router.command("reload", prefixes=".", me=True)
+    async def reload_plugin(client, message: Message):
+        """Reloads one plugin (or every changed plugin) without reconnecting the clients."""
+        parts = message.text.split(None, 1)
+        if len(parts) > 1:
+            reports = [await plugin_loader.reload(parts[1].strip())]
+        else:
+            reports = await plugin_loader.reload_changed() or ["No plugin files changed."]
+        await outbox.reply_text(message, "🔄 **Plugin reload**\n```\n" + "\n".join(reports) + "\n```")
+
+    @router.command("away", me=True)
+    async def set_away_status(client, message: Message):
+        config['status'] = 'offline'
+        await outbox.reply_text(message, "✅ Auto-reply is now **ON**. Send `/online` when you're back.")
+        log.info("[%s] Auto-reply status set to OFF", account.name)
+
+    @router.command("online", me=True)
+    async def set_online_status(client, message: Message):
+        config['status'] = 'online'
+        # Drop replies that were still waiting to be sent
+        auto_replies.cancel_all()
+        await outbox.reply_text(message, "✅ Auto-reply is now **OFF**. Send `/away` to enable it.")
+        log.info("[%s] Auto-reply status set to ON", account.name)
+        if config.get('away_digest', True):
+            # One batched summary of everything that came in, posted to Saved Messages
+            task_manager.spawn(send_away_digest(client, config, away_log), name="away_digest")
+
+    # Any other private message from someone else falls through to the auto-reply
+    @router.fallback(me=False, private=True, incoming=True)
+    async def auto_reply(client, message: Message):
+        await auto_reply_handler(client, message, config, auto_replies, rules, away_log)
+
+
+# --- Auto-Reply Handler ---
+
+# Runs for every incoming private message: its command record is only worth logging at DEBUG
+@timed("auto_reply", level=logging.DEBUG)
+async def auto_reply_handler(client: Client, message: Message, config: dict, auto_replies: AutoReplyScheduler,
+                             rules: RuleMatcher = None, away_log: AwayLog = None):
+    """
+    Schedules the offline reply for an incoming private message while the status is 'offline'.
+    The first matching auto-reply rule picks the text; otherwise it is the offline message.
+    The message is also added to the away log for the digest sent on /online.
+    """
+    if config.get('status') != 'offline':
+        return
+
+    if away_log is not None and config.get('away_digest', True):
+        try:
+            await away_log.record(message)
+        except Exception as e:
+            log.error("Could not add the message to the away log: %s", e)
+
+    async def send_reply():
+        """Sends the offline message. Returns False when nothing was sent."""
+        if config.get('status') != 'offline':
+            return False
+        try:
+            current_message = rules.match(message) if rules else None
+            if current_message is None:
+                current_message = config.get('offline_message', "I am currently offline.")
+            await outbox.reply_text(message, current_message)
+            # Hot path: only formatted when the "main" logger is at DEBUG
+            log.debug("Replied to %s with: '%s'", message.from_user.first_name, current_message)
+        except Exception as e:
+            log.error("An error occurred during auto-reply: %s", e)
+            return False
+
+    # A burst from the same chat collapses into one reply to its latest message
+    auto_replies.schedule(message.chat.id, send_reply)
 
 async def main():
     """Main function to run the auto-reply bot."""
@@ -200,7 +404,7 @@ async def main():
                     'gemini_api_key': None,
                     'bot_token': bot_token # Save the bot token collected from the input
                 }
-                save_config(initial_config)
+                await save_config(initial_config)
                 print("Credentials saved. Please re-run the script to start the user session setup.")
                 return
             except (ValueError, Exception) as e:
@@ -215,8 +419,8 @@ async def main():
                 print("Setup process finished. Please re-run the script to start the main bot.")
                 return
 
-    # --- User Session Check ---
-    if 'session_string' not in config or not config.get('session_string'):
+    # --- User Session Check (classic single-account layout) ---
+    if not config.get('accounts') and not config.get('session_string'):
         print("User session not found. Starting one-time user authentication process...")
         await setup_user_session()
         print("User session created. Please re-run the script to start the main bot.")
@@ -228,7 +432,7 @@ async def main():
         api_key = getpass.getpass("Enter your Gemini API Key: ")
         if api_key:
             config['gemini_api_key'] = api_key
-            save_config(config)
+            await save_config(config)
             # Reload config to ensure we have the latest version for the next step
             config = load_config()
             print("Gemini API Key saved. Restarting bot to apply changes...")
@@ -238,91 +442,96 @@ async def main():
             print("Warning: Gemini API Key not provided. AI commands will be disabled.")
 
 
-    # --- Create and run the main auto-reply client ---
+    # --- Create and run one set of clients per account (all on this event loop) ---
+    # From here on, output goes through the queued logger (formatted and written off the loop)
+    log_system.configure(config)
+    config.subscribe('log_level', lambda key, old, new: log_system.set_levels(config))
+    config.subscribe('log_levels', lambda key, old, new: log_system.set_levels(config))
     try:
-        # Initialize the user bot client using the saved session string
-        user_app = Client(SESSION_NAME, session_string=config['session_string'])
-
-        # Initialize the BotFather client using the API key and bot token from config (if available)
-        bot_app_token = config.get('bot_token')
-        if bot_app_token:
-             # The bot client runs alongside the user bot
-             bot_app = Client("control_bot", 
-                              bot_token=bot_app_token,
-                              api_id=config['api_id'],
-                              api_hash=config['api_hash'])
-             print("Control Bot Client initialized.")
-        else:
-             bot_app = None
-             print("Control Bot Token not found. Only user-bot commands (.commands) will work.")
-
-
-        # Load plugins for both user_app and bot_app
-        print("\nLoading plugins...")
-        load_plugins(user_app, config, is_control_bot=False)
-        if bot_app:
-            load_plugins(bot_app, config, is_control_bot=True)
-        
-        # --- Core command handlers (only for the user bot) ---
+        accounts = []
+        for account_config in account_configs(config):
+            if not account_config.get('session_string'):
+                log.warning("Skipping account '%s': no session_string in its config entry.", account_config.name)
+                continue
+            accounts.append(Account(account_config, first=not accounts))
+        if not accounts:
+            log.error("No account with a session string was found. Please check your configuration.")
+            return
 
-        @user_app.on_message(filters.command("editoff") & filters.me)
-        async def edit_offline_message(client, message: Message):
-            """Handles the /editoff command to update the offline message."""
-            try:
-                new_message = message.text.split(" ", 1)[1].strip()
-                config['offline_message'] = new_message
-                save_config(config)
-                await message.reply_text(f"Offline message updated successfully to: \n`{new_message}`")
-            except IndexError:
-                await message.reply_text("Please provide a new message after the /editoff command.\nExample: `/editoff I will reply later.`")
-            except Exception as e:
-                await message.reply_text(f"An error occurred: {e}")
-
-        @user_app.on_message(filters.command("away") & filters.me)
-        async def set_away_status(client, message: Message):
-            config['status'] = 'offline'
-            save_config(config)
-            await message.reply_text("✅ Auto-reply is now **ON**. Send `/online` when you're back.")
-            print("Auto-reply status set to OFF")
-
-        @user_app.on_message(filters.command("online") & filters.me)
-        async def set_online_status(client, message: Message):
-            config['status'] = 'online'
-            save_config(config)
-            await message.reply_text("✅ Auto-reply is now **OFF**. Send `/away` to enable it.")
-            print("Auto-reply status set to ON")
+        # Plugins are imported once and shared by every account; each client gets its account's config
+        log.info("Loading plugins...")
+        job_queue.configure(config)
+        plugin_loader = PluginLoader(config)
+        for account in accounts:
+            load_plugins(plugin_loader, account.user_app, is_control_bot=False, config=account.config)
+            if account.bot_app:
+                load_plugins(plugin_loader, account.bot_app, is_control_bot=True, config=account.config)
+            register_core_handlers(account, plugin_loader)
+        log.info("%s", plugin_loader.report())
+
+        # Apply tuning changes as soon as they land in the config store
+        for key in ('auto_reply_delay', 'auto_reply_cooldown', 'auto_reply_max_peers', 'auto_reply_rules'):
+            config.subscribe(key, lambda key, old, new: [account.configure() for account in accounts])
+        config.subscribe('rate_limits', lambda key, old, new: rate_limiter.configure(config))
+        config.subscribe('job_concurrency', lambda key, old, new: job_queue.configure(config))
+        config.subscribe('task_concurrency', lambda key, old, new: task_manager.configure(config))
+
+        log.info("Telegram Auto-reply bot is running...")
+        for account in accounts:
+            log.info("[%s] User Bot Client is connected.", account.name)
+            if account.bot_app:
+                log.info("[%s] Control Bot Client is connected.", account.name)
+        log.info("Press Ctrl+C to stop the bot.")
         
-        @user_app.on_message(filters.private & filters.incoming & ~filters.me)
-        async def auto_reply(client, message: Message):
-            if config.get('status') == 'offline':
-                try:
-                    current_message = config.get('offline_message', "I am currently offline.")
-                    await asyncio.sleep(3)
-                    await message.reply(current_message)
-                    print(f"Replied to {message.from_user.first_name} with: '{current_message}'")
-                except Exception as e:
-                    print(f"An error occurred during auto-reply: {e}")
-
-        print("\nTelegram Auto-reply bot is running...")
-        print("User Bot Client is connected.")
-        if bot_app:
-            print("Control Bot Client is connected.")
-        print("Press Ctrl+C to stop the bot.")
-        
-        # Start both clients concurrently
-        clients_to_run = [user_app]
-        if bot_app:
-            clients_to_run.append(bot_app)
-
-        await asyncio.gather(*(client.start() for client in clients_to_run))
-        await idle()
-        await asyncio.gather(*(client.stop() for client in clients_to_run))
+        # Start every client of every account concurrently
+        clients_to_run = [client for account in accounts for client in account.clients]
+
+        # The shared HTTP pool lives exactly as long as the Telegram clients
+        rate_limiter.configure(config)
+        task_manager.configure(config)
+        outbox.configure(config)
+        metrics_server = None
+        # Started inside the try, so whatever did start is cleaned up if a later step fails
+        # (close() and stop() are no-ops for what never started)
+        try:
+            await http_client.start(config)
+            # Optional Prometheus endpoint (set 'metrics_port' in config.json)
+            metrics_server = await start_metrics_server(config)
+            # Measures event-loop lag and captures the stack of anything that blocks it (see .health)
+            watchdog.configure(config)
+            await watchdog.start()
+            await asyncio.gather(*(client.start() for client in clients_to_run))
+            # Pick up .ai/.img jobs that were queued or running when the bot last stopped
+            await resume_jobs(plugin_loader)
+            if config.get('plugin_autoreload'):
+                # Poll the plugins folder and hot-reload edited plugins
+                plugin_loader.watch(config.get('plugin_autoreload_interval', 2.0))
+            await idle()
+            plugin_loader.stop_watching()
+            # Unfinished jobs stay in the queue and run again after the next start
+            await job_queue.stop()
+            await task_manager.shutdown()
+            await asyncio.gather(*(client.stop() for client in clients_to_run))
+        finally:
+            await watchdog.stop()
+            if metrics_server:
+                metrics_server.close()
+            await http_client.close()
+            # Stop the image worker processes and close the cache databases
+            image_pipeline.close()
+            response_cache.close()
+            image_cache.close()
+            # Persist any change still waiting in the write batch
+            await config.flush()
 
 
     except Exception as e:
-        print(f"An error occurred while starting the main bot. Please check your configuration. ({e})")
+        log.error("An error occurred while starting the main bot. Please check your configuration. (%s)", e)
         
 if __name__ == "__main__":
+    # uvloop/orjson (runtime_profile "fast") have to be chosen before the event loop starts
+    runtime.activate(runtime.select_profile(CONFIG_FILE))
+    print(runtime.report())
     try:
         asyncio.run(main())
     except SetupCompleteError:
@@ -334,3 +543,6 @@ if __name__ == "__main__":
              pass
         else:
             raise
+    finally:
+        # Write out whatever is still queued for the log
+        log_system.stop()
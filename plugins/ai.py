@@ -2,124 +2,486 @@
 
 from pyrogram import Client, filters
 from pyrogram.types import Message
-import json
-import requests
-import asyncio
 import time
+import asyncio
+from collections import OrderedDict
+from core.http import http_client, HttpError, RequestError
+from core.cache import response_cache
+from core.similar import similar_prompts
+from core.ratelimit import PRIORITY_OWNER, PRIORITY_BOT
+from core.metrics import timed
+from core.singleflight import SingleFlight
+from core.jobs import job_queue
+from core.router import router_for
+from core.outbox import outbox
+from core.log import get_logger
 
 # --- Gemini API Constants ---
-API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent"
+MODEL = "gemini-2.5-flash-preview-05-20"
+API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+API_URL = f"{API_BASE}/{MODEL}:generateContent"
+STREAM_API_URL = f"{API_BASE}/{MODEL}:streamGenerateContent"
+SYSTEM_INSTRUCTION = "You are a helpful and concise AI assistant."
 SESSION_NAME = 'user_bot_session' # Defined here to distinguish the user client
 
-def call_gemini_api(api_key: str, prompt: str, use_search: bool = True):
+log = get_logger("ai") # Level adjustable with "log_levels": {"ai": "DEBUG"}
+
+# Commands handled by this plugin (read by the loader without importing the module)
+COMMANDS = {"user": ["ai", "ai!", "aireset"], "bot": ["ai", "ai!", "aireset"]}
+
+# --- Request Deduplication ---
+gemini_flights = SingleFlight("gemini") # One upstream call per identical in-flight request
+partial_listeners = {} # cache key -> on_partial callbacks of every caller sharing that call
+
+# --- Streaming Constants ---
+STREAM_EDIT_INTERVAL = 1.5 # Minimum seconds between progressive edits (Telegram flood limits)
+STREAM_PREVIEW_LIMIT = 4000 # Telegram rejects messages longer than 4096 characters
+
+# --- Conversation Memory Constants ---
+CONTEXT_TOKEN_BUDGET = 2000 # Hard cap on history tokens sent along with each prompt
+CONTEXT_MAX_CHATS = 200 # Conversations kept in memory; the least recently used are dropped
+SUMMARY_SHARE = 0.25 # Part of the budget the rolling summary may occupy
+CHARS_PER_TOKEN = 4 # Local estimate when Gemini does not report usageMetadata
+SUMMARY_INSTRUCTION = (
+    "Merge the existing summary and the new conversation turns into one short summary. "
+    "Keep names, facts, decisions and open questions. Reply with the summary only."
+)
+
+
+def configure_endpoints(api_base: str = API_BASE):
+    """Points the plugin at another API base URL (e.g. a proxy or the offline benchmark stub)."""
+    global API_URL, STREAM_API_URL
+    api_base = api_base.rstrip("/")
+    API_URL = f"{api_base}/{MODEL}:generateContent"
+    STREAM_API_URL = f"{api_base}/{MODEL}:streamGenerateContent"
+
+
+def extract_sources(candidate: dict) -> list:
+    """Builds the markdown source links from a candidate's grounding metadata."""
+    grounding_metadata = candidate.get('groundingMetadata', {})
+    if not grounding_metadata or not grounding_metadata.get('groundingAttributions'):
+        return []
+    return [
+        f"[{i+1}]({attr.get('web', {}).get('uri')})"
+        for i, attr in enumerate(grounding_metadata['groundingAttributions'])
+        if attr.get('web', {}).get('uri')
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for text Gemini has not measured (about four characters per token)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clip_to_tokens(text: str, tokens: int) -> str:
+    """Keeps the newest part of text that fits in the given number of tokens."""
+    limit = max(0, tokens) * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[len(text) - limit:]
+
+
+class Conversation:
+    """History of one chat: a rolling summary of older turns plus the most recent turns verbatim."""
+
+    def __init__(self):
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = [] # [role, text, tokens], oldest first
+        self.lock = asyncio.Lock() # One compaction at a time
+
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(turn[2] for turn in self.turns)
+
+    def contents(self) -> list:
+        """Renders the history as Gemini `contents` entries (without the new prompt)."""
+        contents = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [{"text": f"Summary of our conversation so far:\n{self.summary}"}]})
+            contents.append({"role": "model", "parts": [{"text": "Understood."}]})
+        for role, text, _ in self.turns:
+            contents.append({"role": role, "parts": [{"text": text}]})
+        return contents
+
+
+class ConversationMemory:
     """
-    Calls the Gemini API to generate content with optional Google Search grounding.
-    Returns the generated text and a list of sources.
+    Per-chat conversation memory with a hard token budget.
+    When a chat's history outgrows the budget, its oldest turns are folded into
+    a rolling summary (written by Gemini, or truncated locally if that fails),
+    so payload size and latency stay bounded however long the thread runs.
+    Chats are kept in an LRU; the least recently used are forgotten first.
     """
-    headers = { 'Content-Type': 'application/json' }
-    
+
+    def __init__(self):
+        self.enabled = False # Opt-in: history keys the cache, so with it on repeats rarely hit
+        self.budget = CONTEXT_TOKEN_BUDGET
+        self.max_chats = CONTEXT_MAX_CHATS
+        self.chats = OrderedDict() # (client name, chat id) -> Conversation
+
+    def configure(self, config: dict):
+        self.enabled = bool(config.get('ai_context', self.enabled))
+        self.budget = max(1, int(config.get('ai_context_tokens', CONTEXT_TOKEN_BUDGET)))
+        self.max_chats = max(1, int(config.get('ai_context_chats', CONTEXT_MAX_CHATS)))
+        while len(self.chats) > self.max_chats:
+            self.chats.popitem(last=False)
+
+    def get(self, key) -> Conversation:
+        """Returns the chat's conversation (creating it) and marks it as recently used."""
+        conversation = self.chats.get(key)
+        if conversation is None:
+            conversation = self.chats[key] = Conversation()
+            while len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(key)
+        return conversation
+
+    def reset(self, key) -> bool:
+        """Forgets a chat's history. Returns False if there was none."""
+        return self.chats.pop(key, None) is not None
+
+    async def record(self, conversation: Conversation, prompt: str, answer: str, usage: dict,
+                     api_key: str, priority: int = PRIORITY_BOT):
+        """Appends a finished exchange and compacts the history if it no longer fits the budget."""
+        usage = usage or {}
+        conversation.turns.append(["user", prompt, estimate_tokens(prompt)])
+        conversation.turns.append(["model", answer, usage.get('candidatesTokenCount') or estimate_tokens(answer)])
+        if conversation.tokens() > self.budget:
+            await self.compact(conversation, api_key, priority)
+
+    async def compact(self, conversation: Conversation, api_key: str, priority: int = PRIORITY_BOT):
+        """Folds the oldest turns into the summary until summary and turns both fit their share of the budget."""
+        async with conversation.lock:
+            summary_budget = max(1, int(self.budget * SUMMARY_SHARE))
+            turns_budget = self.budget - summary_budget
+            folded = []
+            while conversation.turns and sum(turn[2] for turn in conversation.turns) > turns_budget:
+                # Fold whole exchanges so the remaining history still starts with a user turn
+                folded.append(conversation.turns.pop(0))
+                if conversation.turns and conversation.turns[0][0] == "model":
+                    folded.append(conversation.turns.pop(0))
+            if not folded and conversation.summary_tokens <= summary_budget:
+                return
+
+            summary, tokens = await summarize_turns(api_key, conversation.summary, folded, summary_budget, priority)
+            if summary is None:
+                # Local fallback: keep the newest part of the old summary plus the folded turns
+                lines = [conversation.summary] if conversation.summary else []
+                lines += [f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text, _ in folded]
+                summary, tokens = "\n".join(lines), None
+            if not tokens or tokens > summary_budget:
+                summary = clip_to_tokens(summary, summary_budget)
+                tokens = estimate_tokens(summary)
+            conversation.summary, conversation.summary_tokens = summary, tokens
+
+
+async def summarize_turns(api_key: str, summary: str, turns: list, max_tokens: int, priority: int = PRIORITY_BOT):
+    """
+    Asks Gemini to merge the old summary with the folded turns.
+    Returns the new summary and its token count, or (None, None) on any failure.
+    """
+    transcript = "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text, _ in turns)
+    prompt = f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript or '(none)'}"
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
-        "systemInstruction": {"parts": [{"text": "You are a helpful and concise AI assistant."}]}
+        "systemInstruction": {"parts": [{"text": SUMMARY_INSTRUCTION}]},
+        "generationConfig": {"maxOutputTokens": max_tokens}
+    }
+    try:
+        result = await http_client.post_json(f"{API_URL}?key={api_key}", payload, endpoint="gemini", priority=priority)
+        text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text')
+        if not text:
+            return None, None
+        return text.strip(), result.get('usageMetadata', {}).get('candidatesTokenCount')
+    except Exception:
+        return None, None
+
+
+conversation_memory = ConversationMemory()
+
+
+async def stream_gemini(url: str, payload: dict, on_partial, priority: int = PRIORITY_BOT):
+    """
+    Reads a streamGenerateContent response chunk by chunk, calling on_partial
+    with the text received so far. Returns the full text, the last candidate
+    that carried grounding metadata (sources usually arrive with the final chunk)
+    and the reported usageMetadata.
+    """
+    pieces = []
+    grounded_candidate = {}
+    usage = {}
+    async for chunk in http_client.stream_sse(url, payload, endpoint="gemini", priority=priority):
+        # usageMetadata is cumulative; the last chunk carries the final counts
+        usage = chunk.get('usageMetadata') or usage
+        candidate = chunk.get('candidates', [{}])[0]
+        for part in candidate.get('content', {}).get('parts', []):
+            if part.get('text'):
+                pieces.append(part['text'])
+        if candidate.get('groundingMetadata'):
+            grounded_candidate = candidate
+        if pieces:
+            await on_partial("".join(pieces))
+    text = "".join(pieces) if pieces else None
+    return text, grounded_candidate, usage
+
+
+async def fetch_gemini(api_key: str, prompt: str, use_search: bool, cache_key: str, stream: bool, priority: int,
+                       history: list = None):
+    """
+    Performs the upstream request for call_gemini_api and caches a successful answer.
+    Streamed chunks are fanned out to every caller waiting on the same request.
+    Returns the generated text, a list of sources and the usageMetadata
+    (None when the text is an error message rather than an answer).
+    """
+    payload = {
+        "contents": list(history or []) + [{"role": "user", "parts": [{"text": prompt}]}],
+        "systemInstruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]}
     }
 
     if use_search:
         payload["tools"] = [{"google_search": {}}]
 
-    # Append API key to the URL
-    full_api_url = f"{API_URL}?key={api_key}"
+    async def broadcast_partial(text: str):
+        for listener in list(partial_listeners.get(cache_key, [])):
+            await listener(text)
 
     try:
-        # Implementing exponential backoff for resilience (max 3 retries)
-        for attempt in range(3):
-            try:
-                # Using synchronous requests for simplicity here, as requests.post is blocking
-                response = requests.post(full_api_url, headers=headers, data=json.dumps(payload))
-                response.raise_for_status() # Raise exception for bad status codes
-                
-                result = response.json()
-                candidate = result.get('candidates', [{}])[0]
-                text = candidate.get('content', {}).get('parts', [{}])[0].get('text', "Error: AI response text missing.")
-
-                sources = []
-                grounding_metadata = candidate.get('groundingMetadata', {})
-                if grounding_metadata and grounding_metadata.get('groundingAttributions'):
-                    sources = [
-                        f"[{i+1}]({attr.get('web', {}).get('uri')})"
-                        for i, attr in enumerate(grounding_metadata['groundingAttributions'])
-                        if attr.get('web', {}).get('uri')
-                    ]
-                
-                return text, sources
-            except requests.exceptions.HTTPError as e:
-                if 429 <= e.response.status_code < 500 and attempt < 2:
-                    # Retry on rate limit errors
-                    time.sleep(2 ** attempt) 
-                    continue
-                raise # Re-raise other HTTP errors
-        
-        return "AI API Error: Maximum retries reached due to rate limiting.", []
+        # The shared client pools connections and retries rate limits with exponential backoff
+        if not stream:
+            result = await http_client.post_json(f"{API_URL}?key={api_key}", payload, endpoint="gemini", priority=priority)
+            candidate = result.get('candidates', [{}])[0]
+            text = candidate.get('content', {}).get('parts', [{}])[0].get('text')
+            usage = result.get('usageMetadata', {})
+        else:
+            text, candidate, usage = await stream_gemini(f"{STREAM_API_URL}?alt=sse&key={api_key}", payload,
+                                                         broadcast_partial, priority)
 
-    except requests.exceptions.RequestException as e:
-        return f"AI API Error: Failed to connect or received a bad response. Details: {e}", []
+        if text is None:
+            # Never cache an empty answer
+            return "Error: AI response text missing.", [], None
+
+        sources = extract_sources(candidate)
+        await response_cache.set(cache_key, [text, sources])
+        if not history:
+            # Standalone answers can also serve reworded versions of the prompt
+            similar_prompts.add(prompt, [text, sources], similar_scope(use_search))
+        return text, sources, usage
+
+    except HttpError as e:
+        if e.status == 429:
+            return "AI API Error: Maximum retries reached due to rate limiting.", [], None
+        return f"AI API Error: Failed to connect or received a bad response. Details: {e}", [], None
+    except RequestError as e:
+        return f"AI API Error: Failed to connect or received a bad response. Details: {e}", [], None
     except Exception as e:
-        return f"AI Processing Error: {e}", []
+        return f"AI Processing Error: {e}", [], None
+
+
+def similar_scope(use_search: bool) -> str:
+    """Answers are only reused between requests with the same model, instruction and search setting."""
+    return f"{MODEL}|{SYSTEM_INSTRUCTION}|{bool(use_search)}"
+
+
+async def call_gemini_api(api_key: str, prompt: str, use_search: bool = True, use_cache: bool = True, on_partial=None,
+                          priority: int = PRIORITY_BOT, history: list = None, details: dict = None):
+    """
+    Calls the Gemini API to generate content with optional Google Search grounding.
+    Answers are served from the response cache when possible; use_cache=False
+    forces a fresh request (the new answer still refreshes the cache).
+    Concurrent identical requests share one upstream call (single-flight).
+    When on_partial is given, the answer is streamed and on_partial(text_so_far)
+    is awaited for every chunk. Requests pass through the shared "gemini" rate
+    limit lane at the given priority.
+    history holds earlier Gemini `contents` of the conversation; it is part of
+    the cache and single-flight key. If details is given, it receives "ok"
+    (False when the text is an error message) and "usage" (usageMetadata).
+    A prompt without history that misses the exact cache may get the stored
+    answer of a near-identical earlier prompt (see core/similar.py); details
+    then also holds "similar": (earlier prompt, similarity).
+    Returns the generated text and a list of sources.
+    """
+    details = {} if details is None else details
+    cache_key = response_cache.make_key(prompt, MODEL, SYSTEM_INSTRUCTION, use_search, history)
+    if use_cache:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            text, sources = cached
+            details.update(ok=True, usage={})
+            return text, sources
+        if not history:
+            match = similar_prompts.lookup(prompt, similar_scope(use_search))
+            if match is not None:
+                (text, sources), matched_prompt, similarity = match
+                details.update(ok=True, usage={}, similar=(matched_prompt, similarity))
+                return text, sources
+
+    listeners = partial_listeners.setdefault(cache_key, [])
+    if on_partial is not None:
+        listeners.append(on_partial)
+    try:
+        text, sources, usage = await gemini_flights.do(
+            cache_key,
+            lambda: fetch_gemini(api_key, prompt, use_search, cache_key, on_partial is not None, priority, history)
+        )
+        details.update(ok=usage is not None, usage=usage or {})
+        return text, sources
+    finally:
+        if on_partial is not None:
+            listeners.remove(on_partial)
+        if not listeners and partial_listeners.get(cache_key) is listeners:
+            del partial_listeners[cache_key]
+
 
+class StreamEditor:
+    """Coalesces streamed partial answers into message edits at a rate Telegram accepts."""
 
+    def __init__(self, edit, interval: float = STREAM_EDIT_INTERVAL):
+        self.edit = edit # async edit(text) of the placeholder message
+        self.interval = interval
+        self.last_edit = 0.0
+        self.last_preview = None
+
+    async def update(self, text: str):
+        """Edits the placeholder with the partial text, skipping edits inside the interval."""
+        now = time.monotonic()
+        if now - self.last_edit < self.interval:
+            return
+        preview = text[:STREAM_PREVIEW_LIMIT] + " ▌"
+        if preview == self.last_preview:
+            return
+        self.last_edit = now
+        self.last_preview = preview
+        try:
+            await self.edit(preview)
+        except Exception:
+            # Progressive edits are best-effort; the final edit always carries the full answer
+            pass
+
+
+@timed("ai")
 async def ai_handler(client: Client, message: Message, config: dict, is_user_bot: bool):
-    """Generic handler for both .ai and /ai commands."""
+    """
+    Generic handler for both .ai and /ai commands.
+    It only acknowledges the command and queues a job; run_ai_job does the work.
+    """
     api_key = config.get('gemini_api_key')
     
     if not api_key:
         # Check if the message is from the owner in private chat to provide instruction
         if is_user_bot and message.chat.type == filters.private and (await client.get_me()).id == message.from_user.id:
-            await message.reply_text("❌ Error: Gemini API Key is missing in the configuration. Please restart the script and enter your key when prompted.")
+            await outbox.reply_text(message, "❌ Error: Gemini API Key is missing in the configuration. Please restart the script and enter your key when prompted.")
+        return
+
+    # Extract the prompt text after the command
+    command_text = message.text.split(None, 1)
+    if len(command_text) < 2:
+        await outbox.reply_text(message, "Please provide a prompt after the command.\nExample: `.ai What is the capital of France?`")
         return
 
+    # Send initial message (placeholder); the job edits it with the answer
+    thinking_msg = await outbox.reply_text(message, "🤖 Thinking...", quote=True)
     try:
-        # Extract the prompt text after the command
-        command_text = message.text.split(None, 1)
-        if len(command_text) < 2:
-            await message.reply_text("Please provide a prompt after the command.\nExample: `.ai What is the capital of France?`")
-            return
-        
-        prompt = command_text[1].strip()
-        
-        # Send initial message (placeholder)
-        thinking_msg = await message.reply_text("🤖 Thinking...", quote=True)
-        
-        # Call the API using a thread pool executor to avoid blocking the event loop
-        text, sources = await client.loop.run_in_executor(
-            None, # Default executor
-            lambda: call_gemini_api(api_key, prompt, use_search=True)
-        )
+        await job_queue.enqueue("ai", client.name, message.chat.id, message.id, thinking_msg.id, {
+            "prompt": command_text[1].strip(),
+            # ".ai!" / "/ai!" bypasses the response cache and always asks Gemini
+            "use_cache": message.command[0] != "ai!",
+            "is_user_bot": is_user_bot,
+        })
+    except Exception as e:
+        await outbox.edit_text(client, thinking_msg.chat.id, thinking_msg.id, f"An unexpected error occurred: {e}")
+        log.error("AI Command Error: %s", e)
+
+
+@timed("ai_job")
+async def run_ai_job(client: Client, config: dict, job):
+    """Answers a queued .ai / /ai command by editing its placeholder message."""
+    api_key = config.get('gemini_api_key')
+    prompt = job.payload['prompt']
+    is_user_bot = job.payload.get('is_user_bot', True)
+
+    async def edit(text: str):
+        # Superseded streaming edits still waiting in the outbox are merged into this one
+        await outbox.edit_text(client, job.chat_id, job.status_id, text, disable_web_page_preview=True)
+
+    try:
+        # Stream the answer into the placeholder unless streaming is disabled in config
+        on_partial = None
+        if config.get('ai_stream', True):
+            on_partial = StreamEditor(edit, config.get('ai_stream_interval', STREAM_EDIT_INTERVAL)).update
+
+        # Earlier turns in this chat are sent along, within the token budget
+        conversation, history = None, None
+        if conversation_memory.enabled:
+            conversation = conversation_memory.get((client.name, job.chat_id))
+            history = conversation.contents()
+
+        # Call the API through the shared async HTTP pool (no executor thread needed)
+        # Owner commands on the user bot jump ahead of control bot requests
+        priority = PRIORITY_OWNER if is_user_bot else PRIORITY_BOT
+        details = {}
+        text, sources = await call_gemini_api(api_key, prompt, use_search=True, use_cache=job.payload.get('use_cache', True),
+                                              on_partial=on_partial, priority=priority, history=history,
+                                              details=details)
         
         response_text = text
         if sources:
             response_text += "\n\n**Sources:** " + " ".join(sources)
+        if details.get('similar'):
+            matched_prompt, similarity = details['similar']
+            response_text += (f"\n\n♻️ _Reused the answer to a similar question ({similarity:.0%} match): "
+                              f"\"{matched_prompt[:100]}\". Send `{'.' if is_user_bot else '/'}ai!` for a fresh answer._")
+
+        await edit(response_text)
 
-        await thinking_msg.edit_text(response_text, disable_web_page_preview=True)
+        # Remember the exchange after replying, so compaction never delays the answer
+        if conversation is not None and details.get('ok'):
+            await conversation_memory.record(conversation, prompt, text, details.get('usage'), api_key, priority)
 
     except Exception as e:
-        await thinking_msg.edit_text(f"An unexpected error occurred: {e}")
-        print(f"AI Command Error: {e}")
+        await edit(f"An unexpected error occurred: {e}")
+        log.error("AI Command Error: %s", e)
+
+
+@timed("aireset")
+async def reset_handler(client: Client, message: Message):
+    """Forgets the conversation history of the current chat."""
+    if conversation_memory.reset((client.name, message.chat.id)):
+        await outbox.reply_text(message, "🧹 Conversation context cleared for this chat.")
+    else:
+        await outbox.reply_text(message, "There is no conversation context in this chat.")
 
 
 def setup(app: Client, config: dict, is_control_bot: bool = False):
     """Registers the AI command handlers for the client."""
+    response_cache.configure(config)
+    similar_prompts.configure(config)
+    conversation_memory.configure(config)
+    configure_endpoints(config.get('gemini_api_base', API_BASE))
+    # Queued .ai commands (including ones left over from the last run) are answered by run_ai_job
+    job_queue.register("ai", run_ai_job)
+    router = router_for(app)
     
     if not is_control_bot:
-        # 1. User Bot Command (.ai)
-        @app.on_message(filters.command("ai", prefixes=".") & filters.me)
+        # 1. User Bot Command (.ai, or .ai! to skip the cache)
+        # Runs as a background task so the acknowledgement never holds a dispatcher worker
+        @router.command(["ai", "ai!"], prefixes=".", me=True, background=True)
         async def user_bot_ai_command(client, message: Message):
             # is_user_bot is True
             await ai_handler(client, message, config, is_user_bot=True)
+
+        # .aireset starts a fresh conversation in the current chat
+        @router.command("aireset", prefixes=".", me=True)
+        async def user_bot_ai_reset_command(client, message: Message):
+            await reset_handler(client, message)
             
     else:
-        # 2. Control Bot Command (/ai)
+        # 2. Control Bot Command (/ai, or /ai! to skip the cache)
         # This branch runs if the app is a bot client (the control bot)
-        @app.on_message(filters.command("ai") & filters.private)
+        @router.command(["ai", "ai!"], private=True, background=True)
         async def control_bot_ai_command(client, message: Message):
             # This handler is restricted to private chats to prevent group spam.
             # is_user_bot is False
-            await ai_handler(client, message, config, is_user_bot=False)
\ No newline at end of file
+            await ai_handler(client, message, config, is_user_bot=False)
+
+        @router.command("aireset", private=True)
+        async def control_bot_ai_reset_command(client, message: Message):
+            await reset_handler(client, message)
\ No newline at end of file
@@ -0,0 +1,49 @@
+# This plugin reports event-loop health: lag percentiles from the watchdog, recent stalls and queue depths.
+
+import time
+from pyrogram import Client
+from pyrogram.types import Message
+from core.watchdog import watchdog
+from core.jobs import job_queue
+from core.tasks import task_manager
+from core.outbox import outbox
+from core.router import router_for
+
+# Commands handled by this plugin (read by the loader without importing the module)
+COMMANDS = {"user": ["health"]}
+
+STACK_PREVIEW = 1200 # Characters of the latest stall's stack shown in the reply
+
+
+def format_health() -> str:
+    """Renders the watchdog statistics as a short Markdown report."""
+    lines = ["**Health**"]
+    stats = watchdog.percentiles()
+    if not watchdog.enabled:
+        lines.append("Loop watchdog is off (`\"watchdog\": false`).")
+    elif not stats:
+        lines.append("No loop lag samples yet.")
+    else:
+        lines.append(
+            f"Loop lag ({len(watchdog.samples)} samples): p50 `{stats['p50'] * 1000:.1f} ms` | "
+            f"p90 `{stats['p90'] * 1000:.1f} ms` | p99 `{stats['p99'] * 1000:.1f} ms` | max `{stats['max'] * 1000:.0f} ms`"
+        )
+    lines.append(
+        f"Jobs running `{len(job_queue.running)}` queued `{job_queue.queued}` | "
+        f"background tasks `{len(task_manager.tasks)}` | outbox `{sum(len(q.pending) for q in outbox.chats.values())}`"
+    )
+    if watchdog.stalls:
+        lines.append(f"Stalls over {watchdog.threshold * 1000:.0f} ms (latest {len(watchdog.stalls)}):")
+        for stall in reversed(watchdog.stalls):
+            lines.append(f"• {time.strftime('%H:%M:%S', time.localtime(stall.started))} blocked `{stall.lag * 1000:.0f} ms`")
+        latest = watchdog.stalls[-1].stack
+        lines.append("Latest stack:\n```\n" + latest[-STACK_PREVIEW:] + "\n```")
+    return "\n".join(lines)
+
+
+def setup(app: Client, config: dict, is_control_bot: bool = False):
+    """Registers the .health command on the user bot."""
+    if not is_control_bot:
+        @router_for(app).command("health", prefixes=".", me=True)
+        async def health_command(client, message: Message):
+            await outbox.reply_text(message, format_health())
@@ -2,26 +2,47 @@
 
 from pyrogram import Client, filters
 from pyrogram.types import Message
-import json
-import requests
 import asyncio
-import base64
 from io import BytesIO
-import time
-from PIL import Image
+from core.media import image_pipeline
+from core.imagecache import image_cache
+from core.http import http_client, HttpError, RequestError
+from core.ratelimit import PRIORITY_OWNER, PRIORITY_BOT
+from core.metrics import timed
+from core.singleflight import SingleFlight
+from core.jobs import job_queue
+from core.router import router_for
+from core.outbox import outbox
+from core.log import get_logger
 
 # --- Imagen API Constants ---
 # We use the 'predict' endpoint for Imagen 3.0
-IMAGE_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/imagen-3.0-generate-002:predict"
+IMAGE_MODEL = "imagen-3.0-generate-002"
+API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+IMAGE_API_URL = f"{API_BASE}/{IMAGE_MODEL}:predict"
 SESSION_NAME = 'user_bot_session' # Defined here to distinguish the user client
 
-def call_imagen_api(api_key: str, prompt: str):
+log = get_logger("image_gen")
+
+# Commands handled by this plugin (read by the loader without importing the module)
+COMMANDS = {"user": ["img", "img!"], "bot": ["img", "img!"]}
+
+# One Imagen call per identical in-flight request, shared by every waiting chat
+image_flights = SingleFlight("imagen")
+
+# Generation parameters sent with every request (also part of the image cache key)
+IMAGEN_PARAMETERS = {
+    "sampleCount": 1, # Requesting only 1 image
+    "aspectRatio": "1:1", # Default to square image
+    "personGeneration": "allow_adult", # Default safety setting
+}
+
+async def call_imagen_api(api_key: str, prompt: str, priority: int = PRIORITY_BOT):
     """
     Calls the Imagen API to generate an image based on the prompt.
+    Requests pass through the shared "imagen" rate limit lane at the given priority.
     Returns base64 image data and any error message.
     """
-    headers = { 'Content-Type': 'application/json' }
-    
     # Imagen API requires a different payload structure (using 'instances' and 'parameters')
     payload = {
         "instances": [
@@ -29,126 +50,223 @@ def call_imagen_api(api_key: str, prompt: str):
                 "prompt": prompt
             }
         ],
-        "parameters": {
-            "sampleCount": 1, # Requesting only 1 image
-            "aspectRatio": "1:1", # Default to square image
-            "personGeneration": "allow_adult", # Default safety setting
-        }
+        "parameters": IMAGEN_PARAMETERS
     }
 
     # Append API key to the URL
     full_api_url = f"{IMAGE_API_URL}?key={api_key}"
 
     try:
-        # Implementing exponential backoff for resilience (max 3 retries)
-        for attempt in range(3):
-            try:
-                # Using synchronous requests for simplicity here
-                response = requests.post(full_api_url, headers=headers, data=json.dumps(payload))
-                response.raise_for_status() # Raise exception for bad status codes
-                
-                result = response.json()
-                
-                # Imagen API returns base64 image bytes in the predictions array
-                predictions = result.get('predictions', [])
-                if predictions and predictions[0].get('bytesBase64Encoded'):
-                    base64_data = predictions[0]['bytesBase64Encoded']
-                    return base64_data, None # Success
-                
-                # Handle cases where the prediction might be filtered or empty
-                error_detail = result.get('error', {}).get('message', 'Unknown prediction error.')
-                return None, f"Image generation failed: {error_detail}"
-
-            except requests.exceptions.HTTPError as e:
-                if 429 <= e.response.status_code < 500 and attempt < 2:
-                    # Retry on rate limit errors
-                    time.sleep(2 ** attempt) 
-                    continue
-                return None, f"API HTTP Error: {e}"
-        
-        return None, "API Error: Maximum retries reached due to rate limiting."
+        # The shared client pools connections and retries rate limits with exponential backoff
+        result = await http_client.post_json(full_api_url, payload, endpoint="imagen", priority=priority)
 
-    except requests.exceptions.RequestException as e:
+        # Imagen API returns base64 image bytes in the predictions array
+        predictions = result.get('predictions', [])
+        if predictions and predictions[0].get('bytesBase64Encoded'):
+            base64_data = predictions[0]['bytesBase64Encoded']
+            return base64_data, None # Success
+
+        # Handle cases where the prediction might be filtered or empty
+        error_detail = result.get('error', {}).get('message', 'Unknown prediction error.')
+        return None, f"Image generation failed: {error_detail}"
+
+    except HttpError as e:
+        if e.status == 429:
+            return None, "API Error: Maximum retries reached due to rate limiting."
+        return None, f"API HTTP Error: {e}"
+    except RequestError as e:
         return None, f"API Request Error: Failed to connect. Details: {e}"
     except Exception as e:
         return None, f"Image Processing Error: {e}"
 
 
+def configure_endpoints(api_base: str = API_BASE):
+    """Points the plugin at another API base URL (e.g. a proxy or the offline benchmark stub)."""
+    global IMAGE_API_URL
+    IMAGE_API_URL = f"{api_base.rstrip('/')}/{IMAGE_MODEL}:predict"
+
+
+async def generate_image(api_key: str, prompt: str, as_document: bool, cache_key: str, priority: int):
+    """
+    Calls Imagen, decodes/re-encodes the result in the worker pool (off the event loop)
+    and keeps the bytes on disk so the same request never needs Imagen again.
+    Returns (image bytes, file name, cached path, error).
+    """
+    base64_data, error = await call_imagen_api(api_key, prompt, priority=priority)
+    if error:
+        return None, None, None, error
+
+    image_bytes, file_name = await image_pipeline.prepare(base64_data, full_fidelity=as_document)
+    cached_path = await image_cache.store(cache_key, image_bytes, file_name)
+    return image_bytes, file_name, cached_path, None
+
+
+def read_image_file(path: str, name: str) -> BytesIO:
+    """Loads a cached image from disk into a named file-like object (runs in a thread)."""
+    with open(path, 'rb') as f:
+        image_file = BytesIO(f.read())
+    image_file.name = name
+    return image_file
+
+
+async def deliver_image(client: Client, chat_id: int, reply_to: int, image, caption: str, as_document: bool):
+    """
+    Sends a file_id or named file-like object as a photo (or document) replying to message reply_to.
+    Returns the sent message and the file_id Telegram assigned to it.
+    """
+    if as_document:
+        sent = await outbox.call(client, chat_id, lambda: client.send_document(
+            chat_id=chat_id,
+            document=image,
+            caption=caption,
+            reply_to_message_id=reply_to
+        ))
+        return sent, sent.document.file_id if sent and sent.document else None
+
+    sent = await outbox.call(client, chat_id, lambda: client.send_photo(
+        chat_id=chat_id,
+        photo=image,
+        caption=caption,
+        reply_to_message_id=reply_to
+    ))
+    return sent, sent.photo.file_id if sent and sent.photo else None
+
+
+@timed("img")
 async def image_handler(client: Client, message: Message, config: dict, is_user_bot: bool):
-    """Generic handler for both .img and /img commands."""
+    """
+    Generic handler for both .img and /img commands.
+    It only acknowledges the command and queues a job; run_image_job does the work.
+    """
     api_key = config.get('gemini_api_key')
     
     if not api_key:
         if is_user_bot and message.chat.type == filters.private and (await client.get_me()).id == message.from_user.id:
-            await message.reply_text("❌ Error: Gemini API Key is missing in the configuration. Please restart the script and enter your key when prompted.")
+            await outbox.reply_text(message, "❌ Error: Gemini API Key is missing in the configuration. Please restart the script and enter your key when prompted.")
+        return
+
+    # Extract the prompt text after the command
+    command_text = message.text.split(None, 1)
+    if len(command_text) < 2:
+        await outbox.reply_text(message, "Please provide a prompt after the command.\nExample: `.img A hyperrealistic cat in a spacesuit.`")
         return
+    
+    prompt = command_text[1].strip()
+
+    # "--png" sends the untouched PNG as a document instead of a compressed photo
+    as_document = config.get('img_send_as_document', False)
+    if prompt.startswith("--png"):
+        as_document = True
+        prompt = prompt[len("--png"):].strip()
+        if not prompt:
+            await outbox.reply_text(message, "Please provide a prompt after `--png`.")
+            return
+
+    # Send initial message (placeholder); the job deletes it once the image is out
+    thinking_msg = await outbox.reply_text(message, "🎨 Generating image... This may take up to 20 seconds.", quote=True)
+    try:
+        await job_queue.enqueue("image_gen", client.name, message.chat.id, message.id, thinking_msg.id, {
+            "prompt": prompt,
+            "as_document": as_document,
+            # ".img!" / "/img!" skips the cache and always generates a new image
+            "use_cache": message.command[0] != "img!",
+            "is_user_bot": is_user_bot,
+        })
+    except Exception as e:
+        await outbox.edit_text(client, thinking_msg.chat.id, thinking_msg.id,
+                               f"An unexpected error occurred: {type(e).__name__}: {e}")
+        log.error("Image Command Fatal Error: %s: %s", type(e).__name__, e)
+
+
+@timed("img_job")
+async def run_image_job(client: Client, config: dict, job):
+    """Generates (or reuses) the image for a queued .img / /img command and sends it."""
+    api_key = config.get('gemini_api_key')
+    prompt = job.payload['prompt']
+    as_document = job.payload.get('as_document', False)
+    use_cache = job.payload.get('use_cache', True)
+    is_user_bot = job.payload.get('is_user_bot', True)
 
     try:
-        # Extract the prompt text after the command
-        command_text = message.text.split(None, 1)
-        if len(command_text) < 2:
-            await message.reply_text("Please provide a prompt after the command.\nExample: `.img A hyperrealistic cat in a spacesuit.`")
+        kind = "document" if as_document else "photo"
+        caption = f"**Prompt:** `{prompt}`\n\nGenerated by Imagen 3"
+        cache_key = image_cache.make_key(prompt, IMAGEN_PARAMETERS, image_pipeline.signature(as_document))
+
+        # --- Cache hit: resend by file_id (no upload), or upload the bytes kept on disk ---
+        cached = await image_cache.lookup(cache_key, client.name, kind) if use_cache else None
+        if cached:
+            sent = False
+            if cached['file_id']:
+                try:
+                    await deliver_image(client, job.chat_id, job.reply_to, cached['file_id'], caption, as_document)
+                    sent = True
+                except Exception:
+                    # Telegram no longer accepts this file_id; fall back to uploading from disk
+                    await image_cache.forget_file_id(cached['path'], client.name, kind)
+            if not sent:
+                image_file = await asyncio.to_thread(read_image_file, cached['path'], cached['name'])
+                _, file_id = await deliver_image(client, job.chat_id, job.reply_to, image_file, caption, as_document)
+                if file_id:
+                    await image_cache.remember_file_id(cached['path'], client.name, kind, file_id)
+            await outbox.delete(client, job.chat_id, job.status_id)
             return
         
-        prompt = command_text[1].strip()
-        
-        # Send initial message (placeholder)
-        thinking_msg = await message.reply_text("🎨 Generating image... This may take up to 20 seconds.", quote=True)
-        
-        # Call the API using a thread pool executor to avoid blocking the event loop
-        base64_data, error = await client.loop.run_in_executor(
-            None, # Default executor
-            lambda: call_imagen_api(api_key, prompt)
+        # 1. Generate, transcode and cache the image; identical concurrent requests share one call
+        priority = PRIORITY_OWNER if is_user_bot else PRIORITY_BOT
+        image_bytes, file_name, cached_path, error = await image_flights.do(
+            cache_key,
+            lambda: generate_image(api_key, prompt, as_document, cache_key, priority)
         )
         
         if error:
-            await thinking_msg.edit_text(f"❌ {error}")
+            await outbox.edit_text(client, job.chat_id, job.status_id, f"❌ {error}")
             return
 
-        # --- Process and Upload Image ---
-        
-        # 1. Decode base64 data to bytes
-        image_bytes = base64.b64decode(base64_data)
-        
+        # --- Upload Image ---
+
         # 2. Create an in-memory file-like object
-        photo_file = BytesIO(image_bytes)
-        
-        # 3. Use PIL to open the bytes and save it back to the buffer to ensure it's a valid Telegram photo (optional, but robust)
-        # We need to explicitly name the file-like object for Pyrogram's send_photo
-        photo_file.name = "generated_image.png"
-        
-        # 4. Send the photo
-        await client.send_photo(
-            chat_id=message.chat.id,
-            photo=photo_file,
-            caption=f"**Prompt:** `{prompt}`\n\nGenerated by Imagen 3",
-            reply_to_message_id=message.id
-        )
+        # We need to explicitly name the file-like object so Pyrogram picks the right type
+        image_file = BytesIO(image_bytes)
+        image_file.name = file_name
+
+        # 3. Send the image: compressed photo by default, or the original PNG as a document
+        _, file_id = await deliver_image(client, job.chat_id, job.reply_to, image_file, caption, as_document)
+        if file_id:
+            await image_cache.remember_file_id(cached_path, client.name, kind, file_id)
 
-        # 5. Delete the thinking message to clean up the chat
-        await thinking_msg.delete()
+        # 4. Delete the thinking message to clean up the chat
+        await outbox.delete(client, job.chat_id, job.status_id)
 
     except Exception as e:
-        # Check if the thinking_msg exists before trying to edit/delete
         try:
-            await thinking_msg.edit_text(f"An unexpected error occurred during image upload: {type(e).__name__}: {e}")
+            await outbox.edit_text(
+                client, job.chat_id, job.status_id, f"An unexpected error occurred during image upload: {type(e).__name__}: {e}"
+            )
         except Exception:
-            await message.reply_text(f"An unexpected error occurred: {type(e).__name__}: {e}")
-        print(f"Image Command Fatal Error: {type(e).__name__}: {e}")
+            await outbox.send_message(client, job.chat_id, f"An unexpected error occurred: {type(e).__name__}: {e}",
+                                      reply_to_message_id=job.reply_to)
+        log.error("Image Command Fatal Error: %s: %s", type(e).__name__, e)
 
 
 def setup(app: Client, config: dict, is_control_bot: bool = False):
     """Registers the image generation command handlers for the client."""
+    image_pipeline.configure(config)
+    image_cache.configure(config)
+    configure_endpoints(config.get('gemini_api_base', API_BASE))
+    # Queued .img commands (including ones left over from the last run) are handled by run_image_job
+    job_queue.register("image_gen", run_image_job)
+    router = router_for(app)
     
     if not is_control_bot:
-        # 1. User Bot Command (.img)
-        @app.on_message(filters.command("img", prefixes=".") & filters.me)
+        # 1. User Bot Command (.img, or .img! to skip the cache)
+        # Runs as a background task so the acknowledgement never holds a dispatcher worker
+        @router.command(["img", "img!"], prefixes=".", me=True, background=True)
         async def user_bot_image_command(client, message: Message):
             await image_handler(client, message, config, is_user_bot=True)
             
     else:
-        # 2. Control Bot Command (/img)
+        # 2. Control Bot Command (/img, or /img! to skip the cache)
         # This handler will run for the BotFather bot
-        @app.on_message(filters.command("img") & filters.private)
+        @router.command(["img", "img!"], private=True, background=True)
         async def control_bot_image_command(client, message: Message):
             await image_handler(client, message, config, is_user_bot=False)
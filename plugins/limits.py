@@ -0,0 +1,36 @@
+# This plugin reports the shared upstream rate limiter's budgets, queue depth and wait times.
+
+from pyrogram import Client
+from pyrogram.types import Message
+from core.ratelimit import rate_limiter
+from core.router import router_for
+from core.outbox import outbox
+
+# Commands handled by this plugin (read by the loader without importing the module)
+COMMANDS = {"user": ["limits"]}
+
+
+def format_limits() -> str:
+    """Renders the limiter statistics as a short Markdown report."""
+    stats = rate_limiter.stats()
+    if not stats:
+        return "**Rate limits**\nNo upstream requests yet."
+
+    lines = ["**Rate limits**"]
+    for name, lane in stats.items():
+        lines.append(
+            f"`{name}`: {lane['rate']:g}/s (burst {lane['burst']}) | "
+            f"queued `{lane['queue_depth']}` | granted `{lane['granted']}` | 429s `{lane['throttled']}` | "
+            f"wait avg `{lane['avg_wait'] * 1000:.0f} ms` max `{lane['max_wait'] * 1000:.0f} ms`"
+        )
+    return "\n".join(lines)
+
+
+def setup(app: Client, config: dict, is_control_bot: bool = False):
+    """Registers the .limits command on the user bot."""
+    rate_limiter.configure(config)
+
+    if not is_control_bot:
+        @router_for(app).command("limits", prefixes=".", me=True)
+        async def limits_command(client, message: Message):
+            await outbox.reply_text(message, format_limits())
@@ -1,14 +1,27 @@
 # This is a sample plugin for the Telegram Auto-reply bot.
 
-from pyrogram import Client, filters
+from pyrogram import Client
 from pyrogram.types import Message
 import time
+from core.metrics import timed
+from core.router import router_for
+from core.outbox import outbox
+
+# Optionally declare your commands so the loader can import the plugin on first use.
+# "user" commands use the "." prefix on your account, "bot" commands use "/" on the control bot.
+COMMANDS = {"user": ["ping"]}
 
 # You must have a setup function to register your handlers.
-# It receives the Pyrogram Client object and the config dictionary.
-def setup(app: Client, config: dict):
+# It receives the Pyrogram Client object, the config dictionary and whether the client is the control bot.
+# Register commands with the client's router (one dict lookup per update) rather than with app.on_message.
+def setup(app: Client, config: dict, is_control_bot: bool = False):
+    if is_control_bot:
+        return
     
-    @app.on_message(filters.command("ping", prefixes=".") & filters.me)
+    router = router_for(app)
+
+    @router.command("ping", prefixes=".", me=True)
+    @timed("ping")
     async def ping_command(client, message: Message):
         """
         A simple ping command that replies with the bot's latency.
@@ -16,15 +29,15 @@ def setup(app: Client, config: dict):
         start_time = time.monotonic()
         
         # Use a new message to measure the latency for sending
-        sent_message = await message.reply_text("Pinging...")
+        sent_message = await outbox.reply_text(message, "Pinging...")
         
         # Calculate total time taken from when the command was processed until the message was sent
         latency = (time.monotonic() - start_time) * 1000 # Convert to milliseconds
         
         # Edit the message with the result
-        await sent_message.edit_text(f"**Pong!** 🏓\nLatency: `{latency:.2f} ms`")
+        await outbox.edit_text(client, sent_message.chat.id, sent_message.id, f"**Pong!** 🏓\nLatency: `{latency:.2f} ms`")
 
     # You can add more handlers here if needed.
-    # @app.on_message(filters.command("hello") & filters.me)
+    # @router.command("hello", prefixes=".", me=True)
     # async def hello_command(client, message: Message):
-    #     await message.reply_text("Hello there!")
\ No newline at end of file
+    #     await outbox.reply_text(message, "Hello there!")
\ No newline at end of file